@@ -50,6 +50,8 @@ def main():
                        help='手动指定最大上下文长度')
     parser.add_argument('--temperature', type=float,
                        help='手动指定模型温度')
+    parser.add_argument('--parallel', '-p', type=int,
+                       help='同时诊断的案例数 (默认: 1，即串行)')
     
     args = parser.parse_args()
     
@@ -64,6 +66,8 @@ def main():
         agent_kwargs['max_context_length'] = args.context_length
     if args.temperature is not None:
         agent_kwargs['temperature'] = args.temperature
+    if args.parallel is not None:
+        agent_kwargs['parallel_cases'] = args.parallel
     
     agent = AIOpsReactAgent(**agent_kwargs)
     
@@ -8,7 +8,8 @@
 """
 
 import logging
-from typing import Dict, Any, List
+from itertools import islice
+from typing import Dict, Any, List, Optional
 
 from ..config import AgentConfig
 
@@ -26,16 +27,38 @@ class ContextManager:
         self.context_compress_threshold = limits["context_compress_threshold"]
         self.max_tool_result_tokens = limits["max_tool_result_tokens"]
     
-    def estimate_message_tokens(self, messages: List[Dict[str, Any]]) -> int:
-        """估算消息列表的token数量"""
+    def count_tokens(self, text: str) -> int:
+        """估算单段文本的token数量"""
+        return len(text) // self.config.token_estimation_ratio
+    
+    def estimate_message_tokens(self, messages: List[Dict[str, Any]], prefix_token_len: Optional[int] = None) -> int:
+        """
+        估算消息列表的token数量
+        
+        Args:
+            messages: 消息列表
+            prefix_token_len: 前两条固定消息（系统提示+任务描述）的已知token数，提供时只统计之后的消息
+        """
+        if prefix_token_len is not None:
+            tail = islice(messages, 2, None)
+        else:
+            prefix_token_len = 0
+            tail = messages
+        
         total_chars = 0
-        for msg in messages:
+        for msg in tail:
             total_chars += len(str(msg.get('content', '')))
-        return total_chars // self.config.token_estimation_ratio
+        return prefix_token_len + total_chars // self.config.token_estimation_ratio
     
-    def manage_context_length(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """智能管理上下文长度，避免超限"""
-        current_tokens = self.estimate_message_tokens(messages)
+    def manage_context_length(self, messages: List[Dict[str, Any]], prefix_token_len: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        智能管理上下文长度，避免超限
+        
+        Args:
+            messages: 消息列表
+            prefix_token_len: 前两条固定消息的已知token数（每个案例计算一次），避免每轮重复统计
+        """
+        current_tokens = self.estimate_message_tokens(messages, prefix_token_len)
         
         # 更严格的压缩策略 - 降低阈值
         if current_tokens <= self.context_compress_threshold:
@@ -103,9 +126,9 @@ class ContextManager:
     
     def compress_for_context_limit(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """针对上下文长度错误进行更激进的压缩"""
-        if len(messages) > 2:
-            # 更激进的压缩 - 只保留系统提示和最近1条消息
-            compressed = [messages[0]] + messages[-1:]
+        if len(messages) > 3:
+            # 更激进的压缩 - 只保留系统提示、任务描述和最近1条消息
+            compressed = messages[:2] + messages[-1:]
             self.loggers['error'].info(f"激进压缩：已压缩到{len(compressed)}条消息，继续重试...")
             return compressed
         else:
@@ -8,24 +8,109 @@
 """
 
 import re
+import ast
+import copy
 import json
 import time
+import logging
+import itertools
+import traceback
+import threading
 import xml.etree.ElementTree as ET
-from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime
 
-from ..config import AgentConfig
-from ..log_system import LoggerSetup
-from ..model import ModelClient
-from ..prompt import SYSTEM_PROMPT
+from ..config import AgentConfig, DEFAULT_MODEL_CONFIGS
+from ..log_system import LoggerSetup, LazyJSON
+from ..model import ModelClient, ContextOverflowError
+from ..prompt import SYSTEM_PROMPT, TOOL_NAMES, TOOL_CALL_RE
+from ..utils import json_utils
+
+try:
+    from lxml import etree as _xml_etree
+except ImportError:  # lxml为可选依赖，未安装时使用标准库的C实现解析器
+    _xml_etree = ET
 
 from .tool_executor import ToolCall, ToolExecutor
 from .context_manager import ContextManager
-from .error_handler import ErrorHandler
+from .error_handler import ErrorHandler, FallbackBreaker
 from .file_discovery import FileDiscovery
 
 
+# 上下文超限错误信息中的关键字（小写）
+_CONTEXT_OVERFLOW_MARKERS = ('context length', 'context_length', 'maximum context', 'too many tokens', 'prompt is too long')
+
+# 工具参数标签匹配模式（模块级预编译）
+_PARAM_PATTERN = re.compile(r'<(\w+)>(.*?)</\1>', re.DOTALL)
+
+
+# 比赛任务提示词模板（静态部分在模块加载时构建，每个案例只做一次拼接）
+_TASK_PROMPT_HEAD = (
+    "\n"
+    "<fault_case>\n"
+    "Please analyze the following fault case and perform root cause localization:\n"
+    "\n"
+    "Fault Case UUID: "
+)
+_TASK_PROMPT_MID = (
+    "\n"
+    "Anomaly Description: "
+)
+_TASK_PROMPT_DATA = (
+    "\n"
+    "</fault_case>\n"
+    "\n"
+    "<available_data>\n"
+)
+_TASK_PROMPT_TAIL = (
+    "\n"
+    "</available_data>\n"
+    "\n"
+    "<analysis_requirements>\n"
+    "You need to complete the following analysis tasks:\n"
+    "1. Analyze the time window when the fault occurred\n"
+    "2. Systematically analyze relevant monitoring data (logs, metrics, traces)\n"
+    "3. Identify the root cause component\n"
+    "4. Determine the fault reason\n"
+    "5. Provide complete reasoning trace\n"
+    "</analysis_requirements>\n"
+    "\n"
+    "<output_requirements>\n"
+    "Output format requirements:\n"
+    "- Each reasoning step must include specific action and observation\n"
+    "- Observation field should be limited to 100 characters, highlighting key information\n"
+    "- Must collect multi-dimensional evidence (metric anomalies, log errors, trace anomalies)\n"
+    "- Reasoning steps should be compact and efficient, avoiding redundancy\n"
+    "- Finally use attempt_completion to submit the result\n"
+    "</output_requirements>\n"
+    "\n"
+    "<instructions>\n"
+    "Please start the analysis.\n"
+    "</instructions>\n"
+)
+
+
+# AgentStep中保留的观察内容首尾各保留的字符数（完整内容只进入日志和对话历史）
+_OBSERVATION_SNAPSHOT_CHARS = 2048
+
+
+def _observation_snapshot(text: str) -> str:
+    """截取观察内容的首尾片段，避免步骤记录中长期持有完整工具结果"""
+    if len(text) <= _OBSERVATION_SNAPSHOT_CHARS * 2:
+        return text
+    omitted = len(text) - _OBSERVATION_SNAPSHOT_CHARS * 2
+    return f"{text[:_OBSERVATION_SNAPSHOT_CHARS]}\n...[省略 {omitted} 字符]...\n{text[-_OBSERVATION_SNAPSHOT_CHARS:]}"
+
+
+@lru_cache(maxsize=256)
+def _parse_kwargs_literal(raw: str) -> Any:
+    """将pd_read_kwargs字面量解析为Python对象（只接受字面量，结果按原始字符串缓存）"""
+    return ast.literal_eval(raw) if raw else {}
+
+
 @dataclass
 class AgentStep:
     """Agent执行步骤"""
@@ -35,14 +120,25 @@ class AgentStep:
     reasoning: Optional[str] = None
 
 
+@dataclass
+class CaseContext:
+    """单个案例的诊断状态（每次诊断独立创建，多个案例可并发诊断）"""
+    uuid: str
+    error_logger: Optional[logging.Logger] = None
+    steps: List[AgentStep] = field(default_factory=list)
+    current_step: int = 0
+    fallback_breaker: FallbackBreaker = field(default_factory=FallbackBreaker)  # 工具回退熔断状态只在本案例内生效
+
+
 class AIOpsReactAgent:
     """CCF AIOps挑战赛专用React模式故障诊断智能体"""
     
-    # 已申请支持的模型配置（委托给配置类）
-    MODEL_CONFIGS = AgentConfig().MODEL_CONFIGS
+    # 已申请支持的模型配置（直接引用配置模块的常量，类加载时不再实例化AgentConfig）
+    MODEL_CONFIGS = DEFAULT_MODEL_CONFIGS
     
     def __init__(self, model_name: str = "deepseek-v3:671b", max_iterations: int = 15, max_model_retries: int = 3, 
-                 max_context_length: Optional[int] = None, temperature: Optional[float] = None):
+                 max_context_length: Optional[int] = None, temperature: Optional[float] = None,
+                 parallel_cases: Optional[int] = None):
         """
         初始化Agent
         
@@ -52,16 +148,22 @@ class AIOpsReactAgent:
             max_model_retries: 模型调用最大重试次数
             max_context_length: 模型支持的最大上下文长度（tokens），如果为None则使用模型的建议配置
             temperature: 模型生成温度，0.0为确定性输出，值越高随机性越强，如果为None则使用模型的建议配置
+            parallel_cases: 同时诊断的案例数，如果为None则使用配置中的默认值
         """
-        # 初始化配置
-        self.config = AgentConfig()
-        self.config.max_iterations = max_iterations
-        self.config.max_model_retries = max_model_retries
+        # 初始化配置（配置对象不可变，运行参数在构造时一次性传入）
+        config_overrides = {
+            "max_iterations": max_iterations,
+            "max_model_retries": max_model_retries,
+        }
+        if parallel_cases is not None:
+            config_overrides["parallel_cases"] = max(1, parallel_cases)
+        self.config = AgentConfig(**config_overrides)
         
         # 自动配置模型参数
         model_config = self.config.get_model_config(model_name)
         
-        self.model_client = ModelClient()
+        # 关闭响应缓存：出错后重试的轮次会原样重发相同的消息，需要重新采样而不是取回刚失败的响应
+        self.model_client = ModelClient(enable_cache=False)
         self.model_name = model_name
         self.max_context_length = max_context_length if max_context_length is not None else model_config["max_context_length"]
         self.temperature = temperature if temperature is not None else model_config["temperature"]
@@ -76,15 +178,18 @@ class AIOpsReactAgent:
         self.error_handler = ErrorHandler(self.config)
         self.file_discovery = FileDiscovery(self.config, self.loggers)
         
-        # 记录执行步骤
-        self.steps: List[AgentStep] = []
-        self.current_step = 0
+        # 工具标签与系统提示中定义的工具一致，复用 prompt 模块预编译的统一正则
+        self._tool_names = frozenset(TOOL_NAMES)
+        self._tool_call_pattern = TOOL_CALL_RE
         
         # 比赛专用配置
         self.competition_mode = True
         
-        # 当前案例的错误日志记录器
-        self.case_error_logger = None
+        # 大模型交互记录的递增序号（用于生成interaction_id）
+        self._interaction_seq = itertools.count(1)
+        
+        # 批量处理中止信号：置位后正在退避等待的重试立即结束，不再占用工作线程
+        self._stop_event = threading.Event()
         
         # 记录初始化
         self._log_initialization()
@@ -95,8 +200,9 @@ class AIOpsReactAgent:
         self.loggers['summary'].info(f"模型: {self.model_name}")
         
         # 显示配置来源
-        context_source = "auto-configured" if self.max_context_length == self.config.get_model_config(self.model_name)["max_context_length"] else "user-specified"
-        temp_source = "auto-configured" if self.temperature == self.config.get_model_config(self.model_name)["temperature"] else "user-specified"
+        model_config = self.config.get_model_config(self.model_name)
+        context_source = "auto-configured" if self.max_context_length == model_config["max_context_length"] else "user-specified"
+        temp_source = "auto-configured" if self.temperature == model_config["temperature"] else "user-specified"
         
         self.loggers['summary'].info(f"模型配置: 最大上下文长度={self.max_context_length:,}tokens ({context_source}), 温度={self.temperature} ({temp_source})")
         self.loggers['summary'].info(f"最大迭代次数: {self.config.max_iterations}")
@@ -106,8 +212,8 @@ class AIOpsReactAgent:
     
     @classmethod
     def get_supported_models(cls) -> Dict[str, Dict[str, Any]]:
-        """获取支持的模型配置信息"""
-        return cls.MODEL_CONFIGS.copy()
+        """获取支持的模型配置信息（返回可修改的副本，共享的配置常量本身只读）"""
+        return {name: dict(config) for name, config in cls.MODEL_CONFIGS.items()}
     
     @classmethod 
     def print_supported_models(cls):
@@ -130,65 +236,75 @@ class AIOpsReactAgent:
     def _log_diagnosis_step(self, step_num: int, action: str, observation: str, reasoning: str = ""):
         """记录诊断步骤 - 增强版本，包含详细和简化两种日志"""
         # 简化版本用于快速浏览
-        self.loggers['diagnosis'].info(f"步骤 {step_num}:")
-        self.loggers['diagnosis'].info(f"  行动: {action}")
-        self.loggers['diagnosis'].info(f"  观察简要: {observation[:300]}{'...' if len(observation) > 300 else ''}")
-        if reasoning:
-            self.loggers['diagnosis'].info(f"  推理简要: {reasoning[:300]}{'...' if len(reasoning) > 300 else ''}")
-        self.loggers['diagnosis'].info("-" * 40)
-        
-        # 详细版本记录到交互日志 - 完整信息
-        self.loggers['interaction'].info(f"=== 诊断步骤 {step_num} - 详细信息 ===")
-        self.loggers['interaction'].info(f"行动: {action}")
-        self.loggers['interaction'].info(f"观察完整内容 (长度: {len(observation)} 字符):")
-        self.loggers['interaction'].info(f"{observation}")
-        if reasoning:
-            self.loggers['interaction'].info(f"推理完整内容 (长度: {len(reasoning)} 字符):")
-            self.loggers['interaction'].info(f"{reasoning}")
-        self.loggers['interaction'].info("=" * 60)
+        diagnosis_logger = self.loggers['diagnosis']
+        if diagnosis_logger.isEnabledFor(logging.INFO):
+            diagnosis_logger.info("步骤 %s:", step_num)
+            diagnosis_logger.info("  行动: %s", action)
+            diagnosis_logger.info("  观察简要: %s%s", observation[:300], '...' if len(observation) > 300 else '')
+            if reasoning:
+                diagnosis_logger.info("  推理简要: %s%s", reasoning[:300], '...' if len(reasoning) > 300 else '')
+            diagnosis_logger.info("-" * 40)
+        
+        # 详细版本记录到交互日志 - 完整信息（大文本以%s参数传入，由日志线程拼接）
+        interaction_logger = self.loggers['interaction']
+        if interaction_logger.isEnabledFor(logging.INFO):
+            interaction_logger.info("=== 诊断步骤 %s - 详细信息 ===", step_num)
+            interaction_logger.info("行动: %s", action)
+            interaction_logger.info("观察完整内容 (长度: %s 字符):", len(observation))
+            interaction_logger.info("%s", observation)
+            if reasoning:
+                interaction_logger.info("推理完整内容 (长度: %s 字符):", len(reasoning))
+                interaction_logger.info("%s", reasoning)
+            interaction_logger.info("=" * 60)
     
-    def _log_model_interaction(self, iteration: int, messages_count: int, response_length: int, response_preview: str = ""):
-        """记录模型交互 - 增强版本"""
-        self.loggers['interaction'].info(f"第 {iteration} 轮模型交互")
-        self.loggers['interaction'].info(f"消息数量: {messages_count}")
-        self.loggers['interaction'].info(f"响应长度: {response_length} 字符")
-        if response_preview:
-            self.loggers['interaction'].info(f"响应预览: {response_preview[:500]}{'...' if len(response_preview) > 500 else ''}")
+    def _log_turn(self, iteration: int, uuid: str, input_messages: List[Dict[str, Any]], 
+                  response: str, duration: float = 0):
+        """记录一轮模型交互：交互日志写摘要，大模型原始交互日志写完整记录"""
+        interaction_logger = self.loggers['interaction']
+        if interaction_logger.isEnabledFor(logging.INFO):
+            interaction_logger.info("第 %s 轮模型交互", iteration)
+            interaction_logger.info("消息数量: %s", len(input_messages))
+            interaction_logger.info("响应长度: %s 字符", len(response))
+            interaction_logger.info("响应预览: %s%s", response[:500], '...' if len(response) > 500 else '')
             # 完整响应记录到详细日志
-            self.loggers['interaction'].debug(f"完整响应内容:\n{response_preview}")
-    
-    def _log_llm_interaction(self, iteration: int, uuid: str, input_messages: List[Dict[str, Any]], 
-                           output_response: str, duration: float = 0, model_name: str = ""):
-        """记录大模型原始交互信息"""
-        separator = "=" * 100
+            interaction_logger.debug("完整响应内容:\n%s", response)
+        
+        llm_logger = self.loggers['llm_interactions']
+        if not llm_logger.isEnabledFor(logging.INFO):
+            return
+        
+        # 消息内容几乎都是字符串，直接取长度，只有非字符串内容才转换
+        total_input_length = 0
+        for msg in input_messages:
+            content = msg.get('content', '')
+            total_input_length += len(content) if isinstance(content, str) else len(str(content))
         
+        separator = "=" * 100
         interaction_data = {
-            "interaction_id": f"{uuid}_{iteration}_{datetime.now().strftime('%H%M%S')}",
+            "interaction_id": f"{uuid}_{iteration}_{next(self._interaction_seq)}",
             "timestamp": datetime.now().isoformat(),
             "iteration": iteration,
             "case_uuid": uuid,
-            "model": model_name,
+            "model": self.model_name,
             "duration_seconds": round(duration, 3),
             "input": {
                 "messages_count": len(input_messages),
-                "messages": input_messages,
-                "total_input_length": sum(len(str(msg.get('content', ''))) for msg in input_messages)
+                # 浅拷贝消息列表：序列化在后台线程进行，而原列表在下一轮会继续追加
+                "messages": list(input_messages),
+                "total_input_length": total_input_length
             },
             "output": {
-                "response": output_response,
-                "response_length": len(output_response)
+                "response": response,
+                "response_length": len(response)
             }
         }
         
-        # 格式化JSON输出，确保中文显示正常
-        formatted_json = json.dumps(interaction_data, ensure_ascii=False, indent=2)
-        
-        # 记录到日志
-        self.loggers['llm_interactions'].info(f"\n{separator}")
-        self.loggers['llm_interactions'].info(f"LLM INTERACTION #{iteration} - CASE: {uuid}")
-        self.loggers['llm_interactions'].info(f"{separator}")
-        self.loggers['llm_interactions'].info(formatted_json)
-        self.loggers['llm_interactions'].info(f"{separator}\n")
+        # 记录到日志 - JSON序列化延迟到日志后台线程中执行
+        llm_logger.info(f"\n{separator}")
+        llm_logger.info(f"LLM INTERACTION #{iteration} - CASE: {uuid}")
+        llm_logger.info(f"{separator}")
+        llm_logger.info("%s", LazyJSON(interaction_data))
+        llm_logger.info(f"{separator}\n")
     
     def parse_xml_tool_calls(self, text: str) -> List[ToolCall]:
         """
@@ -200,26 +316,67 @@ class AIOpsReactAgent:
         Returns:
             解析出的工具调用列表
         """
+        # 优先使用XML解析器（C实现）；响应不是合法XML时回退到正则解析
+        tool_calls = self._parse_tool_calls_xml(text)
+        if tool_calls is not None:
+            return tool_calls
+        
         tool_calls = []
         
-        # 查找所有可能的工具调用
-        for tool_name in self.tool_executor.tools.keys():
-            # 构建正则表达式匹配对应的XML标签
-            pattern = f'<{tool_name}>(.*?)</{tool_name}>'
-            matches = re.findall(pattern, text, re.DOTALL)
+        # 单次扫描查找所有工具调用，结果按在响应中出现的顺序排列
+        for tool_name, match in self._tool_call_pattern.findall(text):
+            try:
+                # 解析参数
+                parameters = self._parse_tool_parameters(match.strip())
+                tool_calls.append(ToolCall(name=tool_name, parameters=parameters))
+                self.loggers['interaction'].debug(f"解析到工具调用: {tool_name}")
+            except Exception as e:
+                self.loggers['interaction'].error(f"解析工具调用 {tool_name} 时出错: {e}")
+                continue
+        
+        return tool_calls
+    
+    def _parse_tool_calls_xml(self, text: str) -> Optional[List[ToolCall]]:
+        """
+        使用XML解析器解析工具调用
+        
+        Args:
+            text: 包含XML工具调用的文本
             
-            for match in matches:
-                try:
-                    # 解析参数
-                    parameters = self._parse_tool_parameters(match.strip())
-                    tool_calls.append(ToolCall(name=tool_name, parameters=parameters))
-                    self.loggers['interaction'].debug(f"解析到工具调用: {tool_name}")
-                except Exception as e:
-                    self.loggers['interaction'].error(f"解析工具调用 {tool_name} 时出错: {e}")
-                    continue
+        Returns:
+            解析出的工具调用列表；响应不是合法XML或参数含嵌套标签时返回None，由调用方回退到正则解析
+        """
+        try:
+            root = _xml_etree.fromstring(f"<root>{text}</root>")
+        except Exception:
+            return None
+        
+        tool_calls = []
+        for element in root.iter():
+            if element.tag not in self._tool_names:
+                continue
+            parameters = {}
+            for child in element:
+                if len(child):
+                    # 参数值中含有嵌套标签，保持与正则解析一致的原文语义
+                    return None
+                parameters[child.tag] = self._convert_parameter(child.tag, (child.text or '').strip())
+            tool_calls.append(ToolCall(name=element.tag, parameters=parameters))
+            self.loggers['interaction'].debug(f"解析到工具调用: {element.tag}")
         
         return tool_calls
     
+    def _convert_parameter(self, param_name: str, param_value: str) -> Any:
+        """按参数名转换参数值的类型"""
+        # 尝试解析特殊类型的参数
+        if param_name == 'pd_read_kwargs':
+            try:
+                # 尝试解析为字典；下游会原地修改kwargs，因此返回缓存结果的副本
+                return copy.deepcopy(_parse_kwargs_literal(param_value))
+            except Exception:
+                return {}
+        return param_value
+    
     def _parse_tool_parameters(self, xml_content: str) -> Dict[str, Any]:
         """
         解析工具参数的XML内容
@@ -232,27 +389,16 @@ class AIOpsReactAgent:
         """
         parameters = {}
         
-        # 使用正则表达式匹配参数标签
-        param_pattern = r'<(\w+)>(.*?)</\1>'
-        matches = re.findall(param_pattern, xml_content, re.DOTALL)
+        # 使用预编译的正则表达式匹配参数标签
+        matches = _PARAM_PATTERN.findall(xml_content)
         
         for param_name, param_value in matches:
-            param_value = param_value.strip()
-            
-            # 尝试解析特殊类型的参数
-            if param_name == 'pd_read_kwargs':
-                try:
-                    # 尝试解析为字典
-                    parameters[param_name] = eval(param_value) if param_value else {}
-                except:
-                    parameters[param_name] = {}
-            else:
-                parameters[param_name] = param_value
+            parameters[param_name] = self._convert_parameter(param_name, param_value.strip())
         
         return parameters
     
     def _call_model_with_retry(self, messages: List[Dict[str, Any]], max_retries: int = None, 
-                             retry_delay: float = None, debug: bool = False) -> str:
+                             retry_delay: float = None, debug: bool = False) -> Tuple[str, List[Dict[str, Any]]]:
         """
         增强的带重试机制的模型调用，支持上下文长度错误处理
         
@@ -263,7 +409,7 @@ class AIOpsReactAgent:
             debug: 是否显示调试信息
             
         Returns:
-            模型响应
+            (模型响应, 实际发送的消息列表) - 若重试过程中因上下文超限进行了压缩，返回压缩后的列表（仅用于记录本轮交互）
             
         Raises:
             Exception: 重试耗尽后仍然失败
@@ -274,7 +420,7 @@ class AIOpsReactAgent:
             retry_delay = self.config.retry_delay
             
         last_error = None
-        original_messages = messages.copy()
+        last_error_lower = ""
         
         for attempt in range(max_retries + 1):
             try:
@@ -282,8 +428,10 @@ class AIOpsReactAgent:
                     self.loggers['error'].warning(f"第 {attempt} 次重试模型调用...")
                     if debug:
                         print(f"🔄 第 {attempt} 次重试模型调用...")
-                    delay = self.error_handler.calculate_retry_delay(attempt, str(last_error) if last_error else "")
-                    time.sleep(delay)
+                    delay = self.error_handler.calculate_retry_delay(attempt, str(last_error) if last_error else "", last_error_lower)
+                    if self._stop_event.wait(delay):
+                        # 批量处理已中止，放弃剩余重试
+                        raise last_error
                 
                 response = self.model_client.chat(
                     messages=messages,
@@ -297,26 +445,27 @@ class AIOpsReactAgent:
                     if debug:
                         print(f"✅ 重试成功（第 {attempt} 次）")
                 
-                return response
+                return response, messages
                 
             except Exception as e:
                 last_error = e
-                error_msg = str(e).lower()
+                error_msg = last_error_lower = str(e).lower()
                 
-                # 检查是否是上下文长度错误
-                if 'context length' in error_msg or 'token' in error_msg:
+                # 检查是否是上下文长度错误（本地预检抛出的 ContextOverflowError 或服务端返回的超限错误）
+                if isinstance(e, ContextOverflowError) or any(marker in error_msg for marker in _CONTEXT_OVERFLOW_MARKERS):
                     self.loggers['error'].warning(f"上下文长度超限，尝试进一步压缩: {e}")
                     
                     # 进一步压缩消息
-                    messages = self.context_manager.compress_for_context_limit(messages)
-                    if len(messages) <= 3:
+                    compressed = self.context_manager.compress_for_context_limit(messages)
+                    if len(compressed) >= len(messages):
                         # 已经压缩到最小，无法继续
                         self.loggers['error'].error(f"无法进一步压缩上下文: {e}")
                         raise e
+                    messages = compressed
                     continue
                 
                 # 检查是否是可重试的错误
-                if not self.error_handler.is_retryable_error(error_msg):
+                if not self.error_handler.is_retryable_error(error_msg, error_msg):
                     self.loggers['error'].error(f"遇到不可重试的错误: {e}")
                     raise e
                 
@@ -346,8 +495,8 @@ class AIOpsReactAgent:
         uuid = case["uuid"]
         description = case["Anomaly Description"]
         
-        # 创建案例特定的错误日志记录器
-        self.case_error_logger = self.logger_setup.create_case_error_logger(uuid)
+        # 创建本案例的诊断状态（含案例特定的错误日志记录器），不修改实例属性以支持并发诊断
+        ctx = CaseContext(uuid=uuid, error_logger=self.logger_setup.create_case_error_logger(uuid))
         
         # 记录诊断开始
         self._log_diagnosis_start(uuid, description)
@@ -356,49 +505,12 @@ class AIOpsReactAgent:
         print(f"描述: {description}")
         print("=" * 80)
         
-        # 重置步骤计数
-        self.steps = []
-        self.current_step = 0
-        
         try:
             # 从故障描述中提取时间窗口并发现相关文件
             file_info = self.file_discovery.discover_relevant_files(description, debug)
             
             # Build competition-specific task prompt
-            task_prompt = f"""
-<fault_case>
-Please analyze the following fault case and perform root cause localization:
-
-Fault Case UUID: {uuid}
-Anomaly Description: {description}
-</fault_case>
-
-<available_data>
-{file_info}
-</available_data>
-
-<analysis_requirements>
-You need to complete the following analysis tasks:
-1. Analyze the time window when the fault occurred
-2. Systematically analyze relevant monitoring data (logs, metrics, traces)
-3. Identify the root cause component
-4. Determine the fault reason
-5. Provide complete reasoning trace
-</analysis_requirements>
-
-<output_requirements>
-Output format requirements:
-- Each reasoning step must include specific action and observation
-- Observation field should be limited to 100 characters, highlighting key information
-- Must collect multi-dimensional evidence (metric anomalies, log errors, trace anomalies)
-- Reasoning steps should be compact and efficient, avoiding redundancy
-- Finally use attempt_completion to submit the result
-</output_requirements>
-
-<instructions>
-Please start the analysis.
-</instructions>
-            """
+            task_prompt = f"{_TASK_PROMPT_HEAD}{uuid}{_TASK_PROMPT_MID}{description}{_TASK_PROMPT_DATA}{file_info}{_TASK_PROMPT_TAIL}"
             
             # 构建初始消息
             messages = [
@@ -406,12 +518,15 @@ Please start the analysis.
                 {"role": "user", "content": task_prompt}
             ]
             
+            # 固定前缀（系统提示+任务描述）的token数每个案例只计算一次
+            prefix_token_len = self.context_manager.count_tokens(SYSTEM_PROMPT) + self.context_manager.count_tokens(task_prompt)
+            
             iteration = 0
             final_result = None
             
             while iteration < self.config.max_iterations:
                 iteration += 1
-                self.current_step += 1
+                ctx.current_step += 1
                 
                 self.loggers['diagnosis'].info(f"第 {iteration} 轮推理开始...")
                 
@@ -420,38 +535,24 @@ Please start the analysis.
                 
                 try:
                     # 上下文管理 - 在调用模型前进行上下文长度检查和压缩
-                    managed_messages = self.context_manager.manage_context_length(messages)
+                    managed_messages = self.context_manager.manage_context_length(messages, prefix_token_len)
                     
-                    # 记录模型交互
-                    self._log_model_interaction(iteration, len(managed_messages), 0)
-                    
-                    # 记录LLM调用开始时间
-                    llm_start_time = datetime.now()
+                    # 记录LLM调用开始时间（单调时钟）
+                    llm_start_time = time.perf_counter()
                     
                     # 使用带重试机制的模型调用
-                    response = self._call_model_with_retry(
+                    response, sent_messages = self._call_model_with_retry(
                         messages=managed_messages,
                         debug=debug
                     )
+                    # 重试时因上下文超限压缩过的消息只用于本轮；完整历史保留，下一轮由上下文管理重新裁剪
+                    managed_messages = sent_messages
                     
                     # 计算LLM调用耗时
-                    llm_duration = (datetime.now() - llm_start_time).total_seconds()
-                    
-                    # 记录LLM原始交互信息
-                    self._log_llm_interaction(
-                        iteration=iteration,
-                        uuid=uuid,
-                        input_messages=managed_messages,
-                        output_response=response,
-                        duration=llm_duration,
-                        model_name=self.model_name
-                    )
+                    llm_duration = time.perf_counter() - llm_start_time
                     
-                    # 更新交互日志（传入完整响应）
-                    self._log_model_interaction(iteration, len(messages), len(response), response)
-                    
-                    # 完整响应记录到交互日志 - 无论是否debug都记录
-                    self.loggers['interaction'].debug(f"完整模型响应:\n{response}")
+                    # 记录本轮模型交互（交互摘要 + 大模型原始交互记录）
+                    self._log_turn(iteration, uuid, managed_messages, response, llm_duration)
                     
                     if debug:
                         print(f"📝 模型响应预览:\n{response[:500]}{'...' if len(response) > 500 else ''}\n")
@@ -467,40 +568,43 @@ Please start the analysis.
                             print(f"❌ {warning_msg}")
                         break
                     
-                    # 执行工具调用
-                    tool_results = []
+                    # 执行工具调用，每个结果执行后立即格式化，不再保留结果对象
+                    parts = ["Tool execution results:\n"]
                     for tool_call in tool_calls:
                         # 始终记录工具执行到日志 - 无论是否debug
-                        self.loggers['interaction'].info(f"执行工具: {tool_call.name}")
-                        self.loggers['interaction'].info(f"工具参数: {json.dumps(tool_call.parameters, ensure_ascii=False)}")
+                        if self.loggers['interaction'].isEnabledFor(logging.INFO):
+                            self.loggers['interaction'].info("执行工具: %s", tool_call.name)
+                            # 执行前立即序列化：验证器和工具函数会原地修改嵌套的kwargs
+                            self.loggers['interaction'].info("工具参数: %s", json_utils.dumps(tool_call.parameters))
                         
                         if debug:
                             print(f"🔧 执行工具: {tool_call.name}")
                         
-                        result = self.tool_executor.execute_tool(tool_call, self.case_error_logger)
-                        tool_results.append((tool_call, result))
+                        result = self.tool_executor.execute_tool(tool_call, ctx.error_logger, ctx.fallback_breaker)
                         
-                        # 记录执行步骤 - 保存完整信息用于详细日志
-                        full_observation = str(result)
+                        # 记录执行步骤 - 完整观察信息只用于日志，步骤中保留首尾片段
+                        full_observation = result if isinstance(result, str) else str(result)
                         full_reasoning = response
                         
                         step = AgentStep(
-                            step_num=self.current_step,
-                            action=f"{tool_call.name}({json.dumps(tool_call.parameters, ensure_ascii=False)})",
-                            observation=full_observation,  # 保存完整观察信息
-                            reasoning=full_reasoning       # 保存完整推理信息
+                            step_num=ctx.current_step,
+                            action=f"{tool_call.name}({json_utils.dumps(tool_call.parameters)})",
+                            observation=_observation_snapshot(full_observation),
+                            reasoning=full_reasoning       # 与response共享同一字符串对象
                         )
-                        self.steps.append(step)
+                        ctx.steps.append(step)
                         
                         # 传递完整信息给日志记录方法
-                        self._log_diagnosis_step(self.current_step, step.action, full_observation, full_reasoning)
+                        self._log_diagnosis_step(ctx.current_step, step.action, full_observation, full_reasoning)
                         
                         # 额外记录工具执行的详细信息
-                        self.loggers['tool'].info(f"工具执行: {tool_call.name}")
-                        self.loggers['tool'].info(f"参数: {json.dumps(tool_call.parameters, ensure_ascii=False, indent=2)}")
-                        self.loggers['tool'].info(f"结果长度: {len(full_observation)} 字符")
-                        self.loggers['tool'].info(f"结果内容:\n{full_observation}")
-                        self.loggers['tool'].info("=" * 60)
+                        tool_logger = self.loggers['tool']
+                        if tool_logger.isEnabledFor(logging.INFO):
+                            tool_logger.info("工具执行: %s", tool_call.name)
+                            tool_logger.info("参数: %s", LazyJSON(tool_call.parameters))
+                            tool_logger.info("结果长度: %s 字符", len(full_observation))
+                            tool_logger.info("结果内容:\n%s", full_observation)
+                            tool_logger.info("=" * 60)
                         
                         # 检查是否完成任务
                         if tool_call.name == "attempt_completion" and "status" in result:
@@ -514,41 +618,41 @@ Please start the analysis.
                                 return {
                                     "status": "completed",
                                     "result": final_result,
-                                    "steps": self.steps,
+                                    "steps": ctx.steps,
                                     "iterations": iteration
                                 }
                             else:
                                 error_msg = f"任务完成调用失败: {result.get('error', '未知错误')}"
                                 self.loggers['diagnosis'].error(error_msg)
                                 self.loggers['interaction'].error(error_msg)  # 也记录到交互日志
-                                if self.case_error_logger:
-                                    self.case_error_logger.error(error_msg)
+                                if ctx.error_logger:
+                                    ctx.error_logger.error(error_msg)
                                 if debug:
                                     print(f"⚠️ {error_msg}")
+                        
+                        parts.append(self.tool_executor.format_tool_result(tool_call, result))
+                        parts.append("\n")
+                        del result, full_observation
                     
-                    # 将工具结果添加到对话历史
-                    tool_results_text = "\n".join([
-                        self.tool_executor.format_tool_result(tool_call, result) 
-                        for tool_call, result in tool_results
-                    ])
+                    # 将工具结果添加到对话历史（前后缀与各结果一次性拼接）
+                    parts.append("Continue analysis.")
                     
                     messages.append({"role": "assistant", "content": response})
-                    messages.append({"role": "user", "content": f"Tool execution results:\n{tool_results_text}\nContinue analysis."})
+                    messages.append({"role": "user", "content": "".join(parts)})
                     
                 except Exception as e:
                     error_msg = f"第 {iteration} 轮执行出错: {e}"
                     self.loggers['diagnosis'].error(error_msg)
                     self.loggers['interaction'].error(error_msg)  # 也记录到交互日志
-                    self.error_handler.log_error_with_context(e, f"第 {iteration} 轮执行", uuid, self.case_error_logger)
+                    self.error_handler.log_error_with_context(e, f"第 {iteration} 轮执行", uuid, ctx.error_logger)
                     if debug:
                         print(f"❌ {error_msg}")
                     else:
                         print("❌", end="", flush=True)
                     
-                    # 无论是否debug都记录完整异常信息到日志
-                    import traceback
-                    full_traceback = traceback.format_exc()
-                    self.loggers['interaction'].debug(f"完整异常堆栈:\n{full_traceback}")
+                    # 无论是否debug都记录完整异常信息到日志（堆栈由日志线程按需格式化）
+                    if self.loggers['interaction'].isEnabledFor(logging.DEBUG):
+                        self.loggers['interaction'].debug("完整异常堆栈:", exc_info=True)
                     
                     if debug:
                         traceback.print_exc()
@@ -566,7 +670,7 @@ Please start the analysis.
             result_summary = {
                 "status": "incomplete",
                 "result": final_result,
-                "steps": self.steps,
+                "steps": ctx.steps,
                 "iterations": iteration,
                 "reason": "达到最大迭代次数" if iteration >= self.config.max_iterations else "执行中断"
             }
@@ -575,14 +679,84 @@ Please start the analysis.
             return result_summary
             
         except Exception as e:
-            self.error_handler.log_error_with_context(e, "诊断单个案例", uuid, self.case_error_logger)
+            self.error_handler.log_error_with_context(e, "诊断单个案例", uuid, ctx.error_logger)
             return {
                 "status": "error", 
                 "error": str(e),
-                "steps": self.steps,
+                "steps": ctx.steps,
                 "iterations": 0
             }
     
+    def _process_case(self, index: int, case: Dict[str, Any], total_cases: int, debug: bool = False) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        处理单个案例并生成提交结果（在线程池中执行）
+        
+        Args:
+            index: 案例序号（从0开始）
+            case: 故障案例
+            total_cases: 案例总数
+            debug: 是否显示调试信息
+            
+        Returns:
+            (提交结果, 是否诊断成功) - 诊断失败时返回兜底结果，处理异常时结果为None
+        """
+        # 案例UUID只取一次，后续日志/回退结果直接复用
+        case_uuid = case.get('uuid', 'unknown')
+        case_result = None
+        succeeded = False
+        try:
+            if debug:
+                print(f"\n{'='*80}")
+                print(f"进度: {index+1}/{total_cases} - {(index+1)/total_cases*100:.1f}%")
+            else:
+                print(f"处理案例 {index+1}/{total_cases}", end=" ", flush=True)
+            
+            self.loggers['summary'].info(f"处理案例 {index+1}/{total_cases}: {case_uuid}")
+            
+            # 诊断单个案例
+            diagnosis_result = self.diagnose_single_case(case, debug=debug)
+            
+            if diagnosis_result["status"] == "completed" and diagnosis_result["result"]:
+                case_result = diagnosis_result["result"]
+                succeeded = True
+                success_msg = f"案例 {case_uuid} 诊断完成"
+                print(f"✅ {success_msg}")
+                self.loggers['summary'].info(success_msg)
+            else:
+                fail_msg = f"案例 {case_uuid} 诊断失败: {diagnosis_result.get('reason', '未知原因')}"
+                print(f"❌ {fail_msg}")
+                self.loggers['summary'].error(fail_msg)
+                
+                # 为失败的案例生成一个基本结果，避免丢失
+                case_result = {
+                    "uuid": case_uuid,
+                    "component": "unknown",
+                    "reason": "analysis_failed", 
+                    "time": "2025-06-06 12:00:00",
+                    "reasoning_trace": [
+                        {
+                            "step": 1,
+                            "action": "DiagnosisAttempt",
+                            "observation": "Automatic diagnosis failed, requires manual investigation"
+                        }
+                    ]
+                }
+            
+        except Exception as e:
+            error_msg = f"处理案例 {case_uuid} 时出错: {e}"
+            self.loggers['summary'].error(error_msg)
+            self.loggers['interaction'].error(error_msg)  # 也记录到交互日志
+            self.error_handler.log_error_with_context(e, f"处理案例 {case_uuid}")
+            
+            # 无论是否debug都记录完整异常信息到日志（堆栈由日志线程按需格式化）
+            if self.loggers['interaction'].isEnabledFor(logging.DEBUG):
+                self.loggers['interaction'].debug("处理案例异常堆栈:", exc_info=True)
+            
+            print(f"❌ {error_msg}")
+            traceback.print_exc()
+        
+        return case_result, succeeded
+    
     def process_input_json(self, input_file: str = "input.json", output_file: str = "answer.json", debug: bool = False) -> Dict[str, Any]:
         """
         处理input.json文件中的所有故障案例，生成answer.json
@@ -621,72 +795,45 @@ Please start the analysis.
         print(f"📊 共 {len(cases)} 个案例")
         self.loggers['summary'].info(f"共发现 {len(cases)} 个故障案例")
         
+        # 打开输出文件，每个案例完成后立即写入，不在内存中累积全部结果
+        try:
+            output_writer = json_utils.JSONArrayWriter(output_file)
+        except Exception as e:
+            error_msg = f"保存结果失败: {e}"
+            print(f"❌ {error_msg}" if debug else "❌ 保存失败")
+            self.loggers['summary'].error(error_msg)
+            self.error_handler.log_error_with_context(e, "保存结果")
+            return {"status": "error", "error": f"保存失败: {str(e)}"}
+        
         # 处理所有案例
-        results = []
         successful_count = 0
         failed_count = 0
         
-        for i, case in enumerate(cases):
-            try:
-                if debug:
-                    print(f"\n{'='*80}")
-                    print(f"进度: {i+1}/{len(cases)} - {(i+1)/len(cases)*100:.1f}%")
-                else:
-                    print(f"处理案例 {i+1}/{len(cases)}", end=" ", flush=True)
-                
-                self.loggers['summary'].info(f"处理案例 {i+1}/{len(cases)}: {case.get('uuid', 'unknown')}")
-                
-                # 诊断单个案例
-                diagnosis_result = self.diagnose_single_case(case, debug=debug)
-                
-                if diagnosis_result["status"] == "completed" and diagnosis_result["result"]:
-                    results.append(diagnosis_result["result"])
-                    successful_count += 1
-                    success_msg = f"案例 {case['uuid']} 诊断完成"
-                    print(f"✅ {success_msg}")
-                    self.loggers['summary'].info(success_msg)
-                else:
-                    failed_count += 1
-                    fail_msg = f"案例 {case['uuid']} 诊断失败: {diagnosis_result.get('reason', '未知原因')}"
-                    print(f"❌ {fail_msg}")
-                    self.loggers['summary'].error(fail_msg)
-                    
-                    # 为失败的案例生成一个基本结果，避免丢失
-                    fallback_result = {
-                        "uuid": case["uuid"],
-                        "component": "unknown",
-                        "reason": "analysis_failed", 
-                        "time": "2025-06-06 12:00:00",
-                        "reasoning_trace": [
-                            {
-                                "step": 1,
-                                "action": "DiagnosisAttempt",
-                                "observation": "Automatic diagnosis failed, requires manual investigation"
-                            }
-                        ]
-                    }
-                    results.append(fallback_result)
-                
-            except Exception as e:
-            
-                self.loggers['summary'].error(error_msg)
-                self.loggers['interaction'].error(error_msg)  # 也记录到交互日志
-                self.error_handler.log_error_with_context(e, f"处理案例 {case.get('uuid', 'unknown')}")
-                failed_count += 1
-                
-                # 无论是否debug都记录完整异常信息到日志
-                import traceback
-                full_traceback = traceback.format_exc()
-                self.loggers['interaction'].debug(f"处理案例异常堆栈:\n{full_traceback}")
-                
-                error_msg = f"处理案例 {case.get('uuid', 'unknown')} 时出错: {e}"
-                print(f"❌ {error_msg}")
-                traceback.print_exc()
-
-        # 保存结果
+        total_cases = len(cases)
+        self._stop_event.clear()
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
+            with output_writer, ThreadPoolExecutor(max_workers=self.config.parallel_cases) as executor:
+                futures = [
+                    executor.submit(self._process_case, i, case, total_cases, debug)
+                    for i, case in enumerate(cases)
+                ]
+                try:
+                    # 按输入顺序收集结果，保证answer.json中案例顺序与输入一致
+                    for future in futures:
+                        case_result, succeeded = future.result()
+                        if succeeded:
+                            successful_count += 1
+                        else:
+                            failed_count += 1
+                        if case_result is not None:
+                            output_writer.write(case_result)
+                except BaseException:
+                    # 写入失败时取消尚未开始的案例，并唤醒正在退避等待的重试，避免继续消耗模型调用
+                    for future in futures:
+                        future.cancel()
+                    self._stop_event.set()
+                    raise
+            
             save_msg = f"结果已保存到 {output_file}"
             if debug:
                 print(f"\n✅ {save_msg}")
@@ -706,31 +853,34 @@ Please start the analysis.
         # 返回统计结果
         summary = {
             "status": "completed",
-            "total_cases": len(cases),
+            "total_cases": total_cases,
             "successful_cases": successful_count,
             "failed_cases": failed_count,
-            "success_rate": successful_count / len(cases) * 100,
+            # 输入为空时成功率记为0，避免除零
+            "success_rate": successful_count / total_cases * 100 if total_cases else 0.0,
             "output_file": output_file
         }
         
+        # 统计文本只构建一次，控制台（debug）和日志共用
+        stats_text = "\n".join([
+            "=" * 80,
+            "处理完成统计:",
+            f"总案例数: {summary['total_cases']}",
+            f"成功案例: {summary['successful_cases']}",
+            f"失败案例: {summary['failed_cases']}",
+            f"成功率: {summary['success_rate']:.1f}%",
+            "=" * 80
+        ])
+
         if debug:
-            print(f"\n{'='*80}")
-            print(f"📊 处理完成统计:")
-            print(f"总案例数: {summary['total_cases']}")
-            print(f"成功案例: {summary['successful_cases']}")
-            print(f"失败案例: {summary['failed_cases']}")
-            print(f"成功率: {summary['success_rate']:.1f}%")
-            print(f"{'='*80}")
+            print(f"\n{stats_text}")
         else:
             print(f"\n📊 完成: 成功{summary['successful_cases']}/{summary['total_cases']} ({summary['success_rate']:.1f}%)")
-        
-        # 记录最终统计信息
-        self.loggers['summary'].info("=" * 80)
-        self.loggers['summary'].info("处理完成统计:")
-        self.loggers['summary'].info(f"总案例数: {summary['total_cases']}")
-        self.loggers['summary'].info(f"成功案例: {summary['successful_cases']}")
-        self.loggers['summary'].info(f"失败案例: {summary['failed_cases']}")
-        self.loggers['summary'].info(f"成功率: {summary['success_rate']:.1f}%")
-        self.loggers['summary'].info("=" * 80)
-        
+
+        # 记录最终统计信息（单条日志记录）
+        self.loggers['summary'].info(stats_text)
+
+        # 等待后台日志线程写完本批次的全部记录
+        self.logger_setup.flush()
+
         return summary 
\ No newline at end of file
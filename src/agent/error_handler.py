@@ -7,14 +7,70 @@
 @description: 错误处理器
 """
 
+import random
 import logging
 import time
-from typing import Dict, Any, Optional
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
 
 from ..config import AgentConfig
 
 
+# 回退策略尝试顺序（只尝试最相关的两种）：表结构未知类错误先预览，其余错误先去掉过滤器重读
+_SCHEMA_FALLBACK_ORDER = ('preview', 'remove_filters')
+_DATA_FALLBACK_ORDER = ('remove_filters', 'minimal_read')
+
+
+# 判定为过滤器错误的关键词
+_FILTER_ERROR_KEYWORDS = frozenset(['malformed filters', 'filter', 'operator'])
+
+
+@lru_cache(maxsize=512)
+def _classify_error(tool_name: str, error_lower: str) -> Tuple[bool, str]:
+    """
+    对工具错误分类（按工具名和小写错误信息缓存，同一错误重复出现时直接命中）
+    
+    Args:
+        tool_name: 工具名称
+        error_lower: 小写的错误信息
+        
+    Returns:
+        (是否应使用过滤器回退策略, 错误建议)
+    """
+    if tool_name == "get_data_from_parquet":
+        use_filter_fallback = any(keyword in error_lower for keyword in _FILTER_ERROR_KEYWORDS)
+        
+        if 'malformed filters' in error_lower:
+            suggestion = "过滤器格式错误，建议检查操作符(使用==,!=,<,>,>=,<=,in,not in)、列名和值格式"
+        elif 'file not found' in error_lower or 'no such file' in error_lower:
+            suggestion = "文件路径不存在，建议使用preview_parquet_in_pd先探索可用文件"
+        elif 'columns not found' in error_lower:
+            suggestion = "指定的列不存在，建议先用preview_parquet_in_pd查看列信息"
+        elif 'memory' in error_lower or 'token' in error_lower:
+            suggestion = "数据量过大，建议增加过滤条件、减少行数或选择关键列"
+        else:
+            suggestion = "建议简化参数：减少过滤条件、限制行数(nrows=500)、选择关键列"
+        return use_filter_fallback, suggestion
+    
+    if tool_name == "preview_parquet_in_pd":
+        if 'file not found' in error_lower:
+            return False, "文件路径不存在，请检查路径格式：data/YYYY-MM-DD/类型-parquet/*.parquet"
+        return False, "文件预览失败，请检查文件路径和权限"
+    
+    return False, "请检查参数格式和数据文件可用性"
+
+
+class FallbackBreaker:
+    """单个案例的回退熔断状态（随案例创建和结束，并发诊断的案例互不影响）"""
+    
+    def __init__(self):
+        # (工具, 文件, 错误签名) -> 连续失败次数 / 熔断开始时间
+        self.failures: Counter = Counter()
+        self.tripped_at: Dict[Tuple[str, str, str], float] = {}
+
+
 class ErrorHandler:
     """智能错误处理器"""
     
@@ -23,7 +79,9 @@ class ErrorHandler:
         self.logger = logging.getLogger('error')
     
     def handle_filter_error_fallback(self, tool_call_name: str, tool_parameters: Dict[str, Any], 
-                                   original_error: Exception, tools: Dict) -> Optional[Dict[str, Any]]:
+                                   original_error: Exception, tools: Dict,
+                                   error_lower: Optional[str] = None,
+                                   breaker: Optional[FallbackBreaker] = None) -> Optional[Dict[str, Any]]:
         """
         处理过滤器错误的智能回退策略
         
@@ -32,21 +90,58 @@ class ErrorHandler:
             tool_parameters: 工具参数
             original_error: 原始错误
             tools: 可用工具字典
+            error_lower: 调用方已转换好的小写错误信息，未提供时自动转换
+            breaker: 当前案例的回退熔断状态，为None时不做熔断
             
         Returns:
             回退执行结果，如果回退失败则返回None
         """
+        file_path = tool_parameters.get('file_path', '')
+        
+        # 熔断检查：本案例中同一文件的同类错误回退已连续失败多次时，冷却期内直接跳过
+        signature = (tool_call_name, str(file_path), str(original_error)[:128])
+        if breaker is not None and self._fallback_circuit_open(breaker, signature):
+            return None
+        
+        if error_lower is None:
+            error_lower = str(original_error).lower()
+        result = self._run_filter_fallback(tool_call_name, file_path, original_error, tools, error_lower)
+        
+        if breaker is not None:
+            if result is None:
+                breaker.failures[signature] += 1
+                if breaker.failures[signature] >= self.config.max_fallback_failures:
+                    breaker.tripped_at[signature] = time.monotonic()
+                    self.logger.warning("回退连续失败 %s 次，暂停回退 %s 秒: %s",
+                                        breaker.failures[signature], self.config.fallback_cooldown_s, file_path)
+            else:
+                breaker.failures.pop(signature, None)
+                breaker.tripped_at.pop(signature, None)
+        
+        return result
+    
+    def _fallback_circuit_open(self, breaker: FallbackBreaker, signature: Tuple[str, str, str]) -> bool:
+        """判断回退熔断是否处于打开状态（冷却期满后允许再次尝试一次）"""
+        tripped_at = breaker.tripped_at.get(signature)
+        if tripped_at is None:
+            return False
+        if time.monotonic() - tripped_at < self.config.fallback_cooldown_s:
+            self.logger.debug("回退已熔断，跳过: %s", signature[1])
+            return True
+        # 冷却期满：清除熔断时间，本次失败会立即重新熔断
+        del breaker.tripped_at[signature]
+        return False
+    
+    def _run_filter_fallback(self, tool_call_name: str, file_path: str, original_error: Exception, 
+                             tools: Dict, error_lower: str) -> Optional[Dict[str, Any]]:
+        """依次执行回退策略，返回第一个成功的结果，全部失败时返回None"""
         try:
             self.logger.info("执行过滤器错误智能回退策略")
             
-            # 获取原始参数
-            original_params = tool_parameters.copy()
-            file_path = original_params.get('file_path', '')
-            
-            # 回退策略序列
-            fallback_strategies = [
-                # 策略1: 移除所有过滤器，只保留基本参数
-                {
+            # 回退策略
+            fallback_strategies = {
+                # 移除所有过滤器，只保留基本参数
+                'remove_filters': {
                     'name': '移除过滤器策略',
                     'params': {
                         'file_path': file_path,
@@ -56,16 +151,16 @@ class ErrorHandler:
                         }
                     }
                 },
-                # 策略2: 最小化读取
-                {
+                # 最小化读取
+                'minimal_read': {
                     'name': '最小化读取策略',
                     'params': {
                         'file_path': file_path,
                         'pd_read_kwargs': {'nrows': 200}
                     }
                 },
-                # 策略3: 预览模式（使用preview工具）
-                {
+                # 预览模式（使用preview工具）
+                'preview': {
                     'name': '预览模式策略',
                     'tool': 'preview_parquet_in_pd',
                     'params': {
@@ -73,12 +168,19 @@ class ErrorHandler:
                         'pd_read_kwargs': {}
                     }
                 }
-            ]
+            }
+            
+            # 按错误类型选择策略顺序：过滤器格式错误或列不存在说明表结构未知，优先预览
+            if 'malformed filters' in error_lower or 'columns not found' in error_lower:
+                strategy_order = _SCHEMA_FALLBACK_ORDER
+            else:
+                strategy_order = _DATA_FALLBACK_ORDER
             
-            # 尝试回退策略
-            for i, strategy in enumerate(fallback_strategies, 1):
+            # 尝试回退策略，任一成功即返回
+            for i, strategy_key in enumerate(strategy_order, 1):
+                strategy = fallback_strategies[strategy_key]
                 try:
-                    self.logger.info(f"尝试回退策略{i}: {strategy['name']}")
+                    self.logger.info("尝试回退策略%s: %s", i, strategy['name'])
                     
                     # 选择工具函数
                     if 'tool' in strategy:
@@ -97,11 +199,11 @@ class ErrorHandler:
                         result['fallback_strategy'] = strategy['name']
                         result['original_error'] = str(original_error)
                         
-                        self.logger.info(f"回退策略{i}成功: {strategy['name']}")
+                        self.logger.info("回退策略%s成功: %s", i, strategy['name'])
                         return result
                     
                 except Exception as fallback_error:
-                    self.logger.warning(f"回退策略{i}失败: {fallback_error}")
+                    self.logger.warning("回退策略%s失败: %s", i, fallback_error)
                     continue
             
             # 所有回退策略都失败
@@ -112,75 +214,74 @@ class ErrorHandler:
             self.logger.error(f"回退策略执行异常: {e}")
             return None
     
-    def get_error_suggestion(self, tool_name: str, error_msg: str) -> str:
+    def get_error_suggestion(self, tool_name: str, error_msg: str, error_lower: Optional[str] = None) -> str:
         """
         根据工具和错误类型提供建议
         
         Args:
             tool_name: 工具名称
             error_msg: 错误信息
+            error_lower: 调用方已转换好的小写错误信息，未提供时自动转换
             
         Returns:
             错误建议
         """
-        error_lower = error_msg.lower()
-        
-        if tool_name == "get_data_from_parquet":
-            if 'malformed filters' in error_lower:
-                return "过滤器格式错误，建议检查操作符(使用==,!=,<,>,>=,<=,in,not in)、列名和值格式"
-            elif 'file not found' in error_lower or 'no such file' in error_lower:
-                return "文件路径不存在，建议使用preview_parquet_in_pd先探索可用文件"
-            elif 'columns not found' in error_lower:
-                return "指定的列不存在，建议先用preview_parquet_in_pd查看列信息"
-            elif 'memory' in error_lower or 'token' in error_lower:
-                return "数据量过大，建议增加过滤条件、减少行数或选择关键列"
-            else:
-                return "建议简化参数：减少过滤条件、限制行数(nrows=500)、选择关键列"
-        
-        elif tool_name == "preview_parquet_in_pd":
-            if 'file not found' in error_lower:
-                return "文件路径不存在，请检查路径格式：data/YYYY-MM-DD/类型-parquet/*.parquet"
-            else:
-                return "文件预览失败，请检查文件路径和权限"
-        
-        return "请检查参数格式和数据文件可用性"
+        if error_lower is None:
+            error_lower = error_msg.lower()
+        return _classify_error(tool_name, error_lower)[1]
     
-    def is_retryable_error(self, error_msg: str) -> bool:
-        """判断错误是否可重试"""
-        error_lower = error_msg.lower()
-        retryable_errors = self.config.get_retry_errors()
-        return any(err in error_lower for err in retryable_errors)
+    def is_retryable_error(self, error_msg: str, error_lower: Optional[str] = None) -> bool:
+        """判断错误是否可重试（error_lower为调用方已转换好的小写错误信息）"""
+        return self.config.is_retryable_error(error_msg if error_lower is None else error_lower)
     
-    def should_use_filter_fallback(self, tool_name: str, error_msg: str) -> bool:
-        """判断是否应该使用过滤器回退策略"""
+    def should_use_filter_fallback(self, tool_name: str, error_msg: str, error_lower: Optional[str] = None) -> bool:
+        """判断是否应该使用过滤器回退策略（error_lower为调用方已转换好的小写错误信息）"""
         if tool_name != "get_data_from_parquet":
             return False
         
-        error_lower = error_msg.lower()
-        filter_error_keywords = ['malformed filters', 'filter', 'operator']
-        return any(keyword in error_lower for keyword in filter_error_keywords)
+        if error_lower is None:
+            error_lower = error_msg.lower()
+        return _classify_error(tool_name, error_lower)[0]
     
-    def calculate_retry_delay(self, attempt: int, error_msg: str) -> float:
-        """计算重试延迟时间"""
+    def calculate_retry_delay(self, attempt: int, error_msg: str, error_lower: Optional[str] = None) -> float:
+        """
+        计算重试延迟时间（截断指数退避 + 随机抖动）
+        
+        多个案例同时遇到同一上游故障时，抖动将重试分散到一个时间窗口内，避免同步重试
+        
+        Args:
+            attempt: 当前重试次数（从1开始）
+            error_msg: 上一次的错误信息
+            error_lower: 调用方已转换好的小写错误信息，未提供时自动转换
+            
+        Returns:
+            延迟秒数
+        """
         base_delay = self.config.retry_delay
-        error_lower = error_msg.lower()
+        retry_cap = self.config.retry_cap
+        if error_lower is None:
+            error_lower = error_msg.lower()
+        
+        # 指数退避，延迟不超过上限
+        delay = min(retry_cap, base_delay * (2 ** max(0, attempt - 1)))
         
         # 对于连接错误，使用更长延迟
         if 'connection' in error_lower or 'timeout' in error_lower:
-            return base_delay * (attempt + 1) * 2
+            delay = min(retry_cap * 4, delay * 2)
         
-        # 其他错误使用指数退避
-        return base_delay * attempt
+        jitter_mode = self.config.retry_jitter_mode
+        if jitter_mode == 'full':
+            return random.uniform(0, delay)
+        if jitter_mode == 'decorrelated':
+            return random.uniform(min(base_delay * 0.5, delay), delay)
+        return delay
     
     def log_error_with_context(self, error: Exception, context: str = "", uuid: str = "", 
                              case_error_logger: Optional[logging.Logger] = None):
-        """记录错误信息，包含完整上下文"""
-        import traceback
-        
-        error_msg = f"错误上下文: {context}\n错误信息: {str(error)}\n堆栈跟踪:\n{traceback.format_exc()}"
-        
-        self.logger.error(error_msg)
+        """记录错误信息，包含完整上下文（堆栈跟踪由日志格式化器按需生成）"""
+        if self.logger.isEnabledFor(logging.ERROR):
+            self.logger.error("错误上下文: %s\n错误信息: %s\n堆栈跟踪:", context, error, exc_info=error)
         
         # 如果有案例特定的错误日志记录器，也记录到那里
-        if case_error_logger:
-            case_error_logger.error(f"案例 {uuid} 错误: {error_msg}") 
\ No newline at end of file
+        if case_error_logger and case_error_logger.isEnabledFor(logging.ERROR):
+            case_error_logger.error("案例 %s 错误: 错误上下文: %s\n错误信息: %s\n堆栈跟踪:", uuid, context, error, exc_info=error) 
\ No newline at end of file
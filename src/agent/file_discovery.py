@@ -9,17 +9,121 @@
 
 import os
 import re
-import glob
 import logging
-from datetime import datetime
-from typing import List, Dict
+from bisect import bisect_left
+from datetime import date
+from functools import lru_cache
+from typing import List, Dict, Iterator, Optional, Tuple
 
 from ..config import AgentConfig
 
 
+# 故障描述中的时间/日期匹配模式（模块级预编译）
+_TIMESTAMP_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z)')
+_DATE_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2})')
+
+
+# 数据目录下各子目录对应的文件类别
+_SUBDIR_CATEGORIES = {
+    'log-parquet': 'log',
+    'trace-parquet': 'trace',
+    'apm': 'metric',
+    'pod': 'metric',
+    'service': 'metric',
+    'infra_node': 'metric',
+    'infra_pod': 'metric',
+    'infra_tidb': 'metric',
+    'other': 'metric',
+}
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    """获取目录的修改时间（纳秒），目录不存在时返回None"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _scan_mtime_key(data_dir: str) -> Tuple[Optional[int], ...]:
+    """数据目录及其各子目录的修改时间，任一目录增删文件后缓存键随之变化"""
+    return (_mtime_ns(data_dir),) + tuple(
+        _mtime_ns(os.path.join(data_dir, subdir)) for subdir in _SUBDIR_CATEGORIES
+    )
+
+
+def _list_parquet(dir_path: str) -> List[str]:
+    """列出目录下的parquet文件（单次readdir，不经过glob的通配符匹配；与glob一样忽略隐藏文件）"""
+    with os.scandir(dir_path) as entries:
+        return [
+            entry.path for entry in entries
+            if entry.name.endswith('.parquet') and not entry.name.startswith('.')
+        ]
+
+
+@lru_cache(maxsize=64)
+def _scan_files_cached(data_dir: str, mtime_key: Tuple[Optional[int], ...]) -> Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]:
+    """
+    扫描数据目录中的parquet文件（按目录修改时间缓存）
+    
+    Args:
+        data_dir: 数据目录
+        mtime_key: 目录修改时间，仅作为缓存键
+        
+    Returns:
+        (日志文件, 指标文件, 调用链文件)，均已排序
+    """
+    files = {'log': [], 'trace': [], 'metric': []}
+    
+    # 只遍历一次数据目录，按子目录名分发到对应类别
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            category = _SUBDIR_CATEGORIES.get(entry.name)
+            if category is not None and entry.is_dir():
+                files[category].extend(_list_parquet(entry.path))
+    
+    return tuple(sorted(files['log'])), tuple(sorted(files['metric'])), tuple(sorted(files['trace']))
+
+
+@lru_cache(maxsize=16)
+def _parse_available_dates(available_dates: Tuple[str, ...]) -> Tuple[Tuple[date, str], ...]:
+    """将日期目录名解析为按日期排序的 (date, 原始字符串) 元组，无法解析的目录名跳过"""
+    parsed = []
+    for date_str in available_dates:
+        try:
+            parsed.append((date.fromisoformat(date_str), date_str))
+        except ValueError:
+            continue
+    return tuple(sorted(parsed))
+
+
+@lru_cache(maxsize=16)
+def _available_dates_cached(processed_dir: str, mtime_ns: Optional[int]) -> Tuple[str, ...]:
+    """获取processed_data下的所有日期目录（按目录修改时间缓存）"""
+    if mtime_ns is None:
+        # processed_data目录不存在
+        return ()
+    with os.scandir(processed_dir) as entries:
+        return tuple(sorted(
+            entry.name for entry in entries
+            if entry.name.startswith('2025-') and entry.is_dir()
+        ))
+
+
 class FileDiscovery:
     """文件发现器 - 负责从故障描述中发现相关文件"""
     
+    # 指标子目录名到展示分组的映射（顺序即展示顺序）
+    _METRIC_DIR_TO_GROUP = {
+        'apm': "APM Metrics",
+        'pod': "Pod Metrics",
+        'service': "Service Metrics",
+        'infra_node': "Infrastructure Node",
+        'infra_pod': "Infrastructure Pod",
+        'infra_tidb': "Infrastructure TiDB",
+        'other': "Other Metrics",
+    }
+    
     def __init__(self, config: AgentConfig, loggers: Dict[str, logging.Logger]):
         self.config = config
         self.loggers = loggers
@@ -40,27 +144,23 @@ class FileDiscovery:
             self.loggers['diagnosis'].info("Start discovering relevant files...")
             
             # 使用正则表达式提取时间信息
-            time_pattern = r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z)'
-            times = re.findall(time_pattern, description)
+            times = _TIMESTAMP_PATTERN.findall(description)
             
             if len(times) >= 2:
                 start_time = times[0]
                 end_time = times[1]
                 
-                self.loggers['diagnosis'].info(f"Extracted time window: {start_time} to {end_time}")
+                self.loggers['diagnosis'].info("Extracted time window: %s to %s", start_time, end_time)
                 
-                # 解析时间并提取日期
-                start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-                end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
-                start_date = start_dt.strftime('%Y-%m-%d')
-                end_date = end_dt.strftime('%Y-%m-%d')
+                # 提取日期（正则已保证 YYYY-MM-DDTHH:MM:SSZ 格式，前10个字符即为日期）
+                start_date = start_time[:10]
+                end_date = end_time[:10]
                 
                 return self._discover_files_for_date_range(start_date, end_date, start_time, end_time)
                 
             else:
                 # 如果无法提取时间，尝试提取日期
-                date_pattern = r'(\d{4}-\d{2}-\d{2})'
-                dates = re.findall(date_pattern, description)
+                dates = _DATE_PATTERN.findall(description)
                 
                 if dates:
                     target_date = dates[0]
@@ -88,7 +188,7 @@ class FileDiscovery:
             # 智能选择最接近的日期
             if available_dates:
                 best_match_date = self._find_best_matching_date(start_date, available_dates)
-                self.loggers['diagnosis'].warning(f"Target date {start_date} has no data, using closest available date: {best_match_date}")
+                self.loggers['diagnosis'].warning("Target date %s has no data, using closest available date: %s", start_date, best_match_date)
                 
                 # 调整时间窗口到匹配日期
                 adjusted_start = start_time.replace(start_date, best_match_date)
@@ -112,14 +212,14 @@ Recommended data directory: {self.config.data_base_path}/processed_data/{best_ma
         # 发现具体文件
         log_files, metric_files, trace_files = self._scan_files_in_directory(processed_data_dir)
         
-        self.loggers['diagnosis'].info(f"Found {len(log_files)} logs, {len(metric_files)} metrics, {len(trace_files)} traces")
+        self.loggers['diagnosis'].info("Found %s logs, %s metrics, %s traces", len(log_files), len(metric_files), len(trace_files))
         
         # 格式化文件信息
         return self._format_file_info(start_time, end_time, start_date, log_files, metric_files, trace_files)
     
     def _discover_files_for_single_date(self, target_date: str) -> str:
         """发现单个日期的相关文件"""
-        self.loggers['diagnosis'].info(f"提取到日期: {target_date}")
+        self.loggers['diagnosis'].info("提取到日期: %s", target_date)
         
         # 检查该日期的数据是否存在
         processed_data_dir = f"{self.config.data_base_path}/processed_data/{target_date}"
@@ -137,148 +237,85 @@ Recommended data directory: {self.config.data_base_path}/processed_data/{best_ma
     
     def _get_available_dates(self) -> List[str]:
         """获取所有可用的数据日期"""
-        available_dates = []
-        pattern = f"{self.config.data_base_path}/processed_data/2025-*"
-        for date_dir in glob.glob(pattern):
-            if os.path.isdir(date_dir):
-                date_name = os.path.basename(date_dir)
-                available_dates.append(date_name)
-        return sorted(available_dates)
+        processed_dir = f"{self.config.data_base_path}/processed_data"
+        return list(_available_dates_cached(processed_dir, _mtime_ns(processed_dir)))
     
     def _find_best_matching_date(self, target_date: str, available_dates: List[str]) -> str:
-        """智能寻找最佳匹配的数据日期"""
+        """智能寻找最佳匹配的数据日期（在已排序的日期上二分查找最近邻）"""
         try:
-            target_dt = datetime.strptime(target_date, '%Y-%m-%d')
-            available_dts = []
-            
-            for date_str in available_dates:
-                try:
-                    dt = datetime.strptime(date_str, '%Y-%m-%d')
-                    available_dts.append((dt, date_str))
-                except:
-                    continue
+            target = date.fromisoformat(target_date)
+            parsed_dates = _parse_available_dates(tuple(available_dates))
             
-            if not available_dts:
+            if not parsed_dates:
                 return available_dates[0] if available_dates else target_date
             
-            # 找到时间差最小的日期
-            best_match = min(available_dts, key=lambda x: abs((x[0] - target_dt).days))
-            return best_match[1]
+            # 插入点左右两侧即为最接近的两个日期，距离相同时取较早的日期
+            index = bisect_left(parsed_dates, (target,))
+            if index == 0:
+                return parsed_dates[0][1]
+            if index == len(parsed_dates):
+                return parsed_dates[-1][1]
+            before, after = parsed_dates[index - 1], parsed_dates[index]
+            return before[1] if (target - before[0]) <= (after[0] - target) else after[1]
             
-        except:
+        except Exception:
             return available_dates[0] if available_dates else target_date
     
     def _scan_files_in_directory(self, data_dir: str) -> tuple:
-        """扫描目录中的文件 - 适配新的数据结构"""
-        log_files = []
-        metric_files = []
-        trace_files = []
-        
-        # 发现日志文件
-        log_pattern = f"{data_dir}/log-parquet/*.parquet"
-        log_files = sorted(glob.glob(log_pattern))
-        
-        # 发现调用链文件
-        trace_pattern = f"{data_dir}/trace-parquet/*.parquet"
-        trace_files = sorted(glob.glob(trace_pattern))
-        
-        # 发现指标文件 - 新的扁平化结构
-        # APM指标
-        apm_pattern = f"{data_dir}/apm/*.parquet"
-        metric_files.extend(glob.glob(apm_pattern))
-        
-        # Pod指标
-        pod_pattern = f"{data_dir}/pod/*.parquet"
-        metric_files.extend(glob.glob(pod_pattern))
-        
-        # Service指标
-        service_pattern = f"{data_dir}/service/*.parquet"
-        metric_files.extend(glob.glob(service_pattern))
-        
-        # 基础设施指标
-        infra_patterns = [
-            f"{data_dir}/infra_node/*.parquet",
-            f"{data_dir}/infra_pod/*.parquet",
-            f"{data_dir}/infra_tidb/*.parquet"
-        ]
-        for pattern in infra_patterns:
-            metric_files.extend(glob.glob(pattern))
-        
-        # 其他指标
-        other_pattern = f"{data_dir}/other/*.parquet"
-        metric_files.extend(glob.glob(other_pattern))
-        
-        metric_files = sorted(metric_files)
-        
-        return log_files, metric_files, trace_files
+        """扫描目录中的文件 - 适配新的数据结构（同一批次中重复扫描直接命中缓存）"""
+        log_files, metric_files, trace_files = _scan_files_cached(data_dir, _scan_mtime_key(data_dir))
+        return list(log_files), list(metric_files), list(trace_files)
     
     def _format_file_info(self, start_time: str, end_time: str, start_date: str, 
                          log_files: List[str], metric_files: List[str], trace_files: List[str]) -> str:
         """格式化文件信息"""
-        file_info_parts = [
-            "## Available monitoring data files (UTC-aligned)",
-            f"Time window: {start_time} to {end_time}",
-            f"Related date: {start_date}",
-            f"File statistics: {len(log_files)} logs, {len(metric_files)} metrics, {len(trace_files)} traces"
-        ]
+        return "\n".join(self._iter_file_info(start_time, end_time, start_date, log_files, metric_files, trace_files))
+    
+    def _iter_file_info(self, start_time: str, end_time: str, start_date: str, 
+                        log_files: List[str], metric_files: List[str], trace_files: List[str]) -> Iterator[str]:
+        """逐行生成文件信息，由调用方一次性拼接"""
+        preview_rows = self.config.preview_rows
+        
+        yield "## Available monitoring data files (UTC-aligned)"
+        yield f"Time window: {start_time} to {end_time}"
+        yield f"Related date: {start_date}"
+        yield f"File statistics: {len(log_files)} logs, {len(metric_files)} metrics, {len(trace_files)} traces"
         
         if log_files:
-            file_info_parts.append("\n### Log files:")
-            for log_file in log_files[:self.config.preview_rows]:
-                file_info_parts.append(f"- {log_file}")
-            if len(log_files) > self.config.preview_rows:
-                file_info_parts.append(f"- ... and {len(log_files) - self.config.preview_rows} more logs")
+            yield "\n### Log files:"
+            for log_file in log_files[:preview_rows]:
+                yield "- " + log_file
+            if len(log_files) > preview_rows:
+                yield f"- ... and {len(log_files) - preview_rows} more logs"
         
         if trace_files:
-            file_info_parts.append("\n### Trace files:")
-            for trace_file in trace_files[:self.config.preview_rows]:
-                file_info_parts.append(f"- {trace_file}")
-            if len(trace_files) > self.config.preview_rows:
-                file_info_parts.append(f"- ... and {len(trace_files) - self.config.preview_rows} more traces")
+            yield "\n### Trace files:"
+            for trace_file in trace_files[:preview_rows]:
+                yield "- " + trace_file
+            if len(trace_files) > preview_rows:
+                yield f"- ... and {len(trace_files) - preview_rows} more traces"
         
         if metric_files:
-            file_info_parts.append("\n### Metric files:")
+            yield "\n### Metric files:"
             # 按类型分组显示指标文件
             metric_groups = self._group_metric_files(metric_files)
             for group_name, files in metric_groups.items():
-                file_info_parts.append(f"\n#### {group_name} ({len(files)} files):")
+                yield f"\n#### {group_name} ({len(files)} files):"
                 for file in files[:3]:  # 每组显示前3个文件
-                    file_info_parts.append(f"- {file}")
+                    yield "- " + file
                 if len(files) > 3:
-                    file_info_parts.append(f"- ... and {len(files) - 3} more")
-        
-        file_info_parts.append("\n💡 **Data is now UTC-aligned**: Timestamps in files match folder dates")
-        file_info_parts.append("💡 **Next steps**: Use preview_parquet_in_pd tool to preview file structure, then use get_data_from_parquet to get specific data.")
+                    yield f"- ... and {len(files) - 3} more"
         
-        return "\n".join(file_info_parts)
+        yield "\n💡 **Data is now UTC-aligned**: Timestamps in files match folder dates"
+        yield "💡 **Next steps**: Use preview_parquet_in_pd tool to preview file structure, then use get_data_from_parquet to get specific data."
     
     def _group_metric_files(self, metric_files: List[str]) -> Dict[str, List[str]]:
-        """将指标文件按类型分组"""
-        groups = {
-            "APM Metrics": [],
-            "Pod Metrics": [],
-            "Service Metrics": [],
-            "Infrastructure Node": [],
-            "Infrastructure Pod": [],
-            "Infrastructure TiDB": [],
-            "Other Metrics": []
-        }
+        """将指标文件按类型分组（按所在子目录名查表，分组顺序固定）"""
+        groups = {group_name: [] for group_name in self._METRIC_DIR_TO_GROUP.values()}
         
         for file in metric_files:
-            if "/apm/" in file:
-                groups["APM Metrics"].append(file)
-            elif "/pod/" in file:
-                groups["Pod Metrics"].append(file)
-            elif "/service/" in file:
-                groups["Service Metrics"].append(file)
-            elif "/infra_node/" in file:
-                groups["Infrastructure Node"].append(file)
-            elif "/infra_pod/" in file:
-                groups["Infrastructure Pod"].append(file)
-            elif "/infra_tidb/" in file:
-                groups["Infrastructure TiDB"].append(file)
-            elif "/other/" in file:
-                groups["Other Metrics"].append(file)
+            group_name = self._METRIC_DIR_TO_GROUP.get(os.path.basename(os.path.dirname(file)), "Other Metrics")
+            groups[group_name].append(file)
         
         # 移除空组
-        return {k: v for k, v in groups.items() if v} 
\ No newline at end of file
+        return {k: v for k, v in groups.items() if v}
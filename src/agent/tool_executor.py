@@ -9,15 +9,61 @@
 
 import json
 import logging
-from typing import Dict, Any, Callable
-from datetime import datetime
+from collections import deque
+from typing import Dict, Any, Callable, Optional
+from time import perf_counter
 from dataclasses import dataclass
 
 from ..config import AgentConfig
+from ..utils import json_utils
 from .validator import ParameterValidator
-from .error_handler import ErrorHandler
+from .error_handler import ErrorHandler, FallbackBreaker
 from ..tools import preview_parquet_in_pd, get_data_from_parquet
 
+try:
+    import numpy as np
+except ImportError:  # 未安装numpy时参数中不会出现numpy类型
+    np = None
+
+try:
+    import fastjsonschema
+except ImportError:  # fastjsonschema为可选依赖，未安装时逐项检查
+    fastjsonschema = None
+
+
+# attempt_completion结果的必需字段
+_COMPLETION_REQUIRED_FIELDS = ("uuid", "component", "reason", "time", "reasoning_trace")
+
+# attempt_completion结果的格式Schema（模块加载时编译为校验函数）
+_COMPLETION_SCHEMA = {
+    "type": "object",
+    "required": list(_COMPLETION_REQUIRED_FIELDS),
+    "properties": {
+        "reasoning_trace": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["step", "action", "observation"]
+            }
+        }
+    }
+}
+_COMPLETION_VALIDATOR = fastjsonschema.compile(_COMPLETION_SCHEMA) if fastjsonschema is not None else None
+
+
+# 压缩工具结果时始终保留的关键字段
+_RESULT_KEY_FIELDS = ('file_path', 'shape', 'columns', 'estimated_tokens', 'actual_rows_read')
+
+# 压缩工具结果时保留的警告和建议字段
+_RESULT_WARNING_FIELDS = ('ai_warning', 'memory_warning', 'suggestion', 'auto_limit_applied')
+
+
+def _data_rows(data: Any) -> Any:
+    """取出工具结果中的数据行：split格式（{"columns", "data"}）取其data，记录列表原样返回"""
+    if isinstance(data, dict) and 'data' in data:
+        return data['data']
+    return data
+
 
 @dataclass
 class ToolCall:
@@ -50,23 +96,19 @@ class ToolExecutor:
             self.loggers['diagnosis'].info("尝试完成任务，解析结果...")
             
             # 尝试解析JSON结果
-            result_data = json.loads(result)
+            result_data = json_utils.loads(result)
             
-            # 验证必需字段
-            required_fields = ["uuid", "component", "reason", "time", "reasoning_trace"]
-            for field in required_fields:
-                if field not in result_data:
-                    error_msg = f"缺少必需字段: {field}"
-                    self.loggers['diagnosis'].error(error_msg)
-                    return {
-                        "status": "error",
-                        "error": error_msg,
-                        "raw_result": result
-                    }
+            # 优先使用预编译的Schema校验，失败时再逐项检查以给出具体错误信息
+            if _COMPLETION_VALIDATOR is not None:
+                try:
+                    _COMPLETION_VALIDATOR(result_data)
+                    error_msg = None
+                except fastjsonschema.JsonSchemaException as e:
+                    error_msg = self._find_completion_error(result_data) or f"结果格式错误: {e.message}"
+            else:
+                error_msg = self._find_completion_error(result_data)
             
-            # 验证reasoning_trace格式
-            if not isinstance(result_data["reasoning_trace"], list):
-                error_msg = "reasoning_trace必须是数组"
+            if error_msg:
                 self.loggers['diagnosis'].error(error_msg)
                 return {
                     "status": "error",
@@ -74,16 +116,6 @@ class ToolExecutor:
                     "raw_result": result
                 }
             
-            for i, step in enumerate(result_data["reasoning_trace"]):
-                if not isinstance(step, dict) or "step" not in step or "action" not in step or "observation" not in step:
-                    error_msg = f"reasoning_trace第{i+1}步格式错误，需要包含step、action、observation字段"
-                    self.loggers['diagnosis'].error(error_msg)
-                    return {
-                        "status": "error",
-                        "error": error_msg,
-                        "raw_result": result
-                    }
-            
             self.loggers['diagnosis'].info("任务完成，结果格式验证通过")
             return {
                 "status": "completed",
@@ -100,20 +132,49 @@ class ToolExecutor:
                 "raw_result": result
             }
     
-    def execute_tool(self, tool_call: ToolCall, case_error_logger: logging.Logger = None) -> Dict[str, Any]:
+    def _find_completion_error(self, result_data: Any) -> Optional[str]:
+        """
+        逐项检查完成结果的格式
+        
+        Args:
+            result_data: 解析后的结果
+            
+        Returns:
+            第一个格式问题的描述，格式正确时返回None
+        """
+        # 验证必需字段
+        for field in _COMPLETION_REQUIRED_FIELDS:
+            if field not in result_data:
+                return f"缺少必需字段: {field}"
+        
+        # 验证reasoning_trace格式
+        if not isinstance(result_data["reasoning_trace"], list):
+            return "reasoning_trace必须是数组"
+        
+        for i, step in enumerate(result_data["reasoning_trace"]):
+            if not isinstance(step, dict) or "step" not in step or "action" not in step or "observation" not in step:
+                return f"reasoning_trace第{i+1}步格式错误，需要包含step、action、observation字段"
+        
+        return None
+    
+    def execute_tool(self, tool_call: ToolCall, case_error_logger: logging.Logger = None,
+                     fallback_breaker: Optional[FallbackBreaker] = None) -> Dict[str, Any]:
         """
         增强的工具执行，支持智能错误处理和自动回退
         
         Args:
             tool_call: 工具调用对象
             case_error_logger: 案例特定的错误日志记录器
+            fallback_breaker: 案例特定的回退熔断状态
             
         Returns:
             工具执行结果
         """
-        start_time = datetime.now()
+        start_time = perf_counter()
         
-        if tool_call.name not in self.tools:
+        # 单次查找取得工具函数，未注册的工具直接返回错误
+        tool_func = self.tools.get(tool_call.name)
+        if tool_func is None:
             error_result = {
                 "error": f"未知工具: {tool_call.name}",
                 "available_tools": list(self.tools.keys())
@@ -126,31 +187,33 @@ class ToolExecutor:
             validated_params = self.validator.validate_tool_parameters(tool_call.name, tool_call.parameters)
             tool_call.parameters = validated_params
         except Exception as e:
-            self.loggers['tool'].warning(f"参数验证失败: {e}")
+            self.loggers['tool'].warning("参数验证失败: %s", e)
         
         try:
-            tool_func = self.tools[tool_call.name]
             result = tool_func(**tool_call.parameters)
             
-            execution_time = (datetime.now() - start_time).total_seconds()
+            execution_time = perf_counter() - start_time
             self._log_tool_execution(tool_call, result, execution_time)
             
             return result
             
         except Exception as e:
-            execution_time = (datetime.now() - start_time).total_seconds()
+            execution_time = perf_counter() - start_time
             error_str = str(e)
+            # 错误信息只转换一次小写，传给后续所有错误分类方法
+            error_lower = error_str.lower()
+            use_filter_fallback = self.error_handler.should_use_filter_fallback(tool_call.name, error_str, error_lower)
             
             # 智能错误处理：针对不同错误类型提供自动回退策略
-            if self.error_handler.should_use_filter_fallback(tool_call.name, error_str):
+            if use_filter_fallback:
                 # 过滤器错误 - 尝试自动回退策略
-                self.loggers['diagnosis'].warning(f"检测到过滤器错误，尝试自动回退: {e}")
+                self.loggers['diagnosis'].warning("检测到过滤器错误，尝试自动回退: %s", e)
                 
                 fallback_result = self.error_handler.handle_filter_error_fallback(
-                    tool_call.name, tool_call.parameters, e, self.tools
+                    tool_call.name, tool_call.parameters, e, self.tools, error_lower, fallback_breaker
                 )
                 if fallback_result:
-                    execution_time = (datetime.now() - start_time).total_seconds()
+                    execution_time = perf_counter() - start_time
                     self._log_tool_execution(tool_call, fallback_result, execution_time)
                     return fallback_result
             
@@ -159,37 +222,49 @@ class ToolExecutor:
                 "error": f"工具执行失败: {error_str}",
                 "tool": tool_call.name,
                 "parameters": tool_call.parameters,
-                "suggestion": self.error_handler.get_error_suggestion(tool_call.name, error_str)
+                "suggestion": self.error_handler.get_error_suggestion(tool_call.name, error_str, error_lower)
             }
             
             self._log_tool_execution(tool_call, error_result, execution_time)
-            self.error_handler.log_error_with_context(e, f"执行工具 {tool_call.name}", case_error_logger=case_error_logger)
+            # 过滤器错误和可重试错误属于已知错误，工具日志已有记录，不再记录完整堆栈
+            if not (use_filter_fallback or self.error_handler.is_retryable_error(error_str, error_lower)):
+                self.error_handler.log_error_with_context(e, f"执行工具 {tool_call.name}", case_error_logger=case_error_logger)
             
             return error_result
     
     def _log_tool_execution(self, tool_call: ToolCall, result: Dict[str, Any], execution_time: float = 0):
-        """记录工具执行，安全处理JSON序列化"""
-        self.loggers['tool'].info(f"执行工具: {tool_call.name}")
+        """记录工具执行，安全处理JSON序列化（整次执行合并为一条日志记录）"""
+        tool_logger = self.loggers['tool']
+        level = logging.ERROR if "error" in result else logging.INFO
+        if not tool_logger.isEnabledFor(level):
+            return
         
-        # 安全的参数序列化
+        lines = [f"执行工具: {tool_call.name}"]
+        
+        # 安全的参数序列化：orjson单次遍历直接处理numpy类型，不支持时再逐层转换
         try:
-            safe_params = self._json_serialize_safe(tool_call.parameters)
-            self.loggers['tool'].info(f"参数: {json.dumps(safe_params, ensure_ascii=False, indent=2)}")
+            try:
+                params_text = json_utils.dumps(tool_call.parameters, indent=True)
+            except TypeError:
+                safe_params = self._json_serialize_safe(tool_call.parameters)
+                params_text = json.dumps(safe_params, ensure_ascii=False, indent=2)
+            lines.append(f"参数: {params_text}")
         except Exception as e:
-            self.loggers['tool'].info(f"参数: {str(tool_call.parameters)} (JSON序列化失败: {e})")
+            lines.append(f"参数: {str(tool_call.parameters)} (JSON序列化失败: {e})")
         
         if "error" in result:
-            self.loggers['tool'].error(f"工具执行失败: {result['error']}")
+            lines.append(f"工具执行失败: {result['error']}")
         else:
-            self.loggers['tool'].info(f"工具执行成功")
+            lines.append("工具执行成功")
             if "data" in result:
-                self.loggers['tool'].info(f"数据条数: {len(result['data'])}")
-                self.loggers['tool'].info(f"数据形状: {result.get('shape', 'N/A')}")
+                lines.append(f"数据条数: {len(_data_rows(result['data']))}")
+                lines.append(f"数据形状: {result.get('shape', 'N/A')}")
         
         if execution_time > 0:
-            self.loggers['tool'].info(f"执行时间: {execution_time:.2f}秒")
+            lines.append(f"执行时间: {execution_time:.2f}秒")
         
-        self.loggers['tool'].info("-" * 40)
+        lines.append("-" * 40)
+        tool_logger.log(level, "\n".join(lines))
     
     def _json_serialize_safe(self, obj: Any) -> Any:
         """
@@ -201,24 +276,34 @@ class ToolExecutor:
         Returns:
             可序列化的对象
         """
-        import numpy as np
-        
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.bool_):
-            return bool(obj)
-        elif isinstance(obj, dict):
-            return {key: self._json_serialize_safe(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [self._json_serialize_safe(item) for item in obj]
-        elif isinstance(obj, tuple):
-            return [self._json_serialize_safe(item) for item in obj]
-        else:
+        if np is None:
             return obj
+        
+        # 迭代遍历嵌套结构（不使用递归），每项为 (父容器, 键/下标, 原始值)
+        root = [None]
+        pending = deque([(root, 0, obj)])
+        while pending:
+            parent, key, value = pending.pop()
+            if isinstance(value, np.ndarray):
+                parent[key] = value.tolist()
+            elif isinstance(value, np.integer):
+                parent[key] = int(value)
+            elif isinstance(value, np.floating):
+                parent[key] = float(value)
+            elif isinstance(value, np.bool_):
+                parent[key] = bool(value)
+            elif isinstance(value, dict):
+                # 先占位再填充，保持键的原有顺序
+                converted = dict.fromkeys(value)
+                parent[key] = converted
+                pending.extend((converted, k, v) for k, v in value.items())
+            elif isinstance(value, (list, tuple)):
+                converted = [None] * len(value)
+                parent[key] = converted
+                pending.extend((converted, i, item) for i, item in enumerate(value))
+            else:
+                parent[key] = value
+        return root[0]
     
     def format_tool_result(self, tool_call: ToolCall, result: Dict[str, Any]) -> str:
         """
@@ -268,25 +353,29 @@ class ToolExecutor:
         compressed = {}
         
         # 始终保留的关键字段
-        key_fields = ['file_path', 'shape', 'columns', 'estimated_tokens', 'actual_rows_read']
-        for field in key_fields:
+        for field in _RESULT_KEY_FIELDS:
             if field in result:
                 compressed[field] = result[field]
         
-        # 有条件保留的字段
+        # 有条件保留的字段：只切片前2条记录，不遍历或序列化完整数据
         if 'data' in result:
             data = result['data']
-            if isinstance(data, list) and len(data) > 0:
-                # 只显示前2条记录和总数
-                compressed['data_sample'] = data[:2]
-                compressed['total_records'] = len(data)
-                compressed['note'] = f"Showing first 2 of {len(data)} records"
+            rows = _data_rows(data)
+            if isinstance(rows, list) and rows:
+                total_records = len(rows)
+                sample = rows[:2]
+                if rows is not data:
+                    # split格式的行还原为记录，模型看到的示例格式不变
+                    columns = data.get('columns', [])
+                    sample = [dict(zip(columns, row)) for row in sample]
+                compressed['data_sample'] = sample
+                compressed['total_records'] = total_records
+                compressed['note'] = f"Showing first 2 of {total_records} records"
             else:
                 compressed['data'] = data
         
         # 保留警告和建议
-        warning_fields = ['ai_warning', 'memory_warning', 'suggestion', 'auto_limit_applied']
-        for field in warning_fields:
+        for field in _RESULT_WARNING_FIELDS:
             if field in result:
                 compressed[field] = result[field]
         
@@ -7,6 +7,9 @@
 @description: 工具参数验证器
 """
 
+import re
+import ast
+import json
 import logging
 from typing import Dict, Any, List, Tuple
 from datetime import datetime
@@ -14,6 +17,22 @@ from datetime import datetime
 from ..config import AgentConfig
 
 
+# 时间戳格式匹配模式（模块级预编译）
+_ISO_TIMESTAMP_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}')
+_STD_TIMESTAMP_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')
+
+# 非标准时间戳依次尝试的解析格式
+_TIMESTAMP_FORMATS = (
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%d %H:%M:%S',
+)
+
+# 列数过多时优先保留的重要列（按优先级排序）
+_IMPORTANT_COLUMNS = ('@timestamp', 'message', 'level', 'k8_pod', 'k8_namespace')
+
+
 class ParameterValidator:
     """工具参数验证和修正器"""
     
@@ -23,12 +42,11 @@ class ParameterValidator:
     
     def validate_tool_parameters(self, tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """增强的验证和修正工具调用参数，智能处理过滤器错误"""
-        validated_params = parameters.copy()
+        # 其他工具无需验证，直接返回原参数（不复制）
+        if tool_name != "get_data_from_parquet":
+            return parameters
         
-        if tool_name == "get_data_from_parquet":
-            validated_params = self._validate_parquet_parameters(validated_params)
-        
-        return validated_params
+        return self._validate_parquet_parameters(parameters.copy())
     
     def _validate_parquet_parameters(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """验证和修正Parquet工具参数"""
@@ -36,13 +54,17 @@ class ParameterValidator:
         if 'pd_read_kwargs' in parameters:
             kwargs = parameters['pd_read_kwargs']
             if isinstance(kwargs, str):
+                # 只解析字面量：先用C实现的JSON解析，再兼容Python字面量写法（单引号、元组等）
                 try:
-                    kwargs = eval(kwargs)
-                    parameters['pd_read_kwargs'] = kwargs
-                except:
-                    parameters['pd_read_kwargs'] = {}
+                    kwargs = json.loads(kwargs)
+                except ValueError:
+                    try:
+                        kwargs = ast.literal_eval(kwargs)
+                    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+                        kwargs = {}
+                parameters['pd_read_kwargs'] = kwargs
             
-            # 智能过滤器验证和修正
+            # 智能过滤器验证和修正（时间戳修正已在过滤器验证中一并完成）
             if isinstance(kwargs, dict) and 'filters' in kwargs:
                 filters = kwargs['filters']
                 if isinstance(filters, list):
@@ -50,7 +72,7 @@ class ParameterValidator:
                     
                     # 如果发现过滤器问题，提供智能回退策略
                     if filter_issues:
-                        self.logger.warning(f"发现过滤器问题: {filter_issues}")
+                        self.logger.warning("发现过滤器问题: %s", filter_issues)
                         
                         # 策略1: 如果所有过滤器都有问题，移除过滤器
                         if not valid_filters:
@@ -59,13 +81,10 @@ class ParameterValidator:
                             # 限制行数以防止数据过大
                             if 'nrows' not in kwargs or kwargs.get('nrows', 1000) > self.config.default_nrows:
                                 kwargs['nrows'] = self.config.default_nrows
-                                self.logger.info(f"设置安全行数限制: {self.config.default_nrows}")
+                                self.logger.info("设置安全行数限制: %s", self.config.default_nrows)
                         else:
                             kwargs['filters'] = valid_filters
-                            self.logger.info(f"保留有效过滤器: {valid_filters}")
-            
-            # 时间戳格式智能修正
-            self._fix_timestamp_formats_in_kwargs(kwargs)
+                            self.logger.info("保留有效过滤器: %s", valid_filters)
             
             # 安全性检查：确保参数合理性
             self._apply_safety_limits(kwargs)
@@ -82,22 +101,35 @@ class ParameterValidator:
         Returns:
             (有效过滤器列表, 问题列表)
         """
-        valid_filters = []
-        issues = []
-        
         supported_ops = self.config.get_supported_filter_operators()
         problematic_columns = self.config.get_problematic_columns()
         
+        # 快速路径：过滤器全部格式正确、操作符受支持且无需修正时，直接返回原列表
+        if all(
+            isinstance(filter_item, list) and len(filter_item) == 3
+            and isinstance(filter_item[1], str) and filter_item[1] in supported_ops
+            and filter_item[2] is not None
+            and isinstance(filter_item[0], str) and filter_item[0] not in problematic_columns
+            and '@timestamp' not in filter_item[0]
+            for filter_item in filters
+        ):
+            return filters, []
+        
+        valid_filters = []
+        issues = []
+        unsupported_ops = self.config.get_unsupported_filter_operators()
+        
         for filter_item in filters:
             if not isinstance(filter_item, list) or len(filter_item) != 3:
                 issues.append(f"过滤器格式错误: {filter_item}")
                 continue
             
             col, op, val = filter_item
+            col_is_str = isinstance(col, str)
             
-            # 检查操作符
-            if op not in supported_ops:
-                if op in ['like', 'contains', 'ilike', 'regex']:
+            # 检查操作符（集合查找要求可哈希，非字符串的操作符/列名一律视为不匹配）
+            if not isinstance(op, str) or op not in supported_ops:
+                if isinstance(op, str) and op in unsupported_ops:
                     issues.append(f"不支持的操作符 '{op}'，已跳过过滤器 {filter_item}")
                     continue
                 else:
@@ -105,7 +137,7 @@ class ParameterValidator:
                     op = '=='
             
             # 检查时间戳格式
-            if '@timestamp' in str(col) and isinstance(val, str):
+            if col_is_str and '@timestamp' in col and isinstance(val, str):
                 # 尝试修正时间戳格式
                 fixed_val = self._fix_timestamp_value(val)
                 if fixed_val != val:
@@ -113,7 +145,7 @@ class ParameterValidator:
                     val = fixed_val
             
             # 检查可能有问题的列名
-            if col in problematic_columns:
+            if col_is_str and col in problematic_columns:
                 issues.append(f"可能有问题的列名 '{col}'，建议预览数据确认列名")
             
             # 检查None值
@@ -125,15 +157,6 @@ class ParameterValidator:
         
         return valid_filters, issues
     
-    def _fix_timestamp_formats_in_kwargs(self, kwargs: Dict[str, Any]):
-        """修正kwargs中的时间戳格式"""
-        if 'filters' in kwargs and isinstance(kwargs['filters'], list):
-            for filter_item in kwargs['filters']:
-                if isinstance(filter_item, list) and len(filter_item) == 3:
-                    col, op, val = filter_item
-                    if '@timestamp' in str(col) and isinstance(val, str):
-                        filter_item[2] = self._fix_timestamp_value(val)
-    
     def _fix_timestamp_value(self, timestamp_str: str) -> str:
         """
         智能修正时间戳格式
@@ -152,31 +175,30 @@ class ParameterValidator:
             fixed = fixed[:-1]
         
         # 处理微秒部分
-        if '.' in fixed and len(fixed.split('.')[-1]) > 6:
+        main_part, sep, micro_part = fixed.partition('.')
+        if sep and len(micro_part) > 6:
             # 截断微秒到6位
-            main_part, micro_part = fixed.rsplit('.', 1)
             fixed = f"{main_part}.{micro_part[:6]}"
         
         # 确保格式为 YYYY-MM-DD HH:MM:SS 或 YYYY-MM-DDTHH:MM:SS
-        import re
-        if re.match(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}', fixed):
+        if _ISO_TIMESTAMP_PATTERN.match(fixed):
             # ISO格式，保持不变
             return fixed
-        elif re.match(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', fixed):
+        elif _STD_TIMESTAMP_PATTERN.match(fixed):
             # 标准格式，保持不变
             return fixed
         else:
             # 其他格式，尝试解析和标准化
             try:
-                # 尝试多种格式解析
-                formats = [
-                    '%Y-%m-%dT%H:%M:%S.%f',
-                    '%Y-%m-%dT%H:%M:%S',
-                    '%Y-%m-%d %H:%M:%S.%f',
-                    '%Y-%m-%d %H:%M:%S',
-                ]
+                # 快速路径：C实现的ISO解析，覆盖绝大多数情况
+                try:
+                    dt = datetime.fromisoformat(fixed.replace(' ', 'T'))
+                    return dt.strftime('%Y-%m-%d %H:%M:%S')
+                except ValueError:
+                    pass
                 
-                for fmt in formats:
+                # 回退：尝试多种格式解析
+                for fmt in _TIMESTAMP_FORMATS:
                     try:
                         dt = datetime.strptime(fixed, fmt)
                         return dt.strftime('%Y-%m-%d %H:%M:%S')
@@ -197,26 +219,22 @@ class ParameterValidator:
                 kwargs['nrows'] = self.config.default_nrows
             else:
                 kwargs['nrows'] = int(self.config.default_nrows * 0.8)
-            self.logger.info(f"添加安全行数限制: {kwargs['nrows']}")
+            self.logger.info("添加安全行数限制: %s", kwargs['nrows'])
         else:
             # 如果指定的行数过大，进行限制
             if kwargs['nrows'] > self.config.max_safe_rows:
-                self.logger.warning(f"行数限制过大({kwargs['nrows']})，调整为{self.config.max_safe_rows}")
+                self.logger.warning("行数限制过大(%s)，调整为%s", kwargs['nrows'], self.config.max_safe_rows)
                 kwargs['nrows'] = self.config.max_safe_rows
         
         # 确保列选择合理
         if 'columns' in kwargs and isinstance(kwargs['columns'], list):
             if len(kwargs['columns']) > self.config.max_columns:
-                self.logger.warning(f"列数过多({len(kwargs['columns'])})，可能影响性能")
-                # 保留前10个重要列
-                important_cols = ['@timestamp', 'message', 'level', 'k8_pod', 'k8_namespace']
-                selected_cols = []
-                for col in important_cols:
-                    if col in kwargs['columns']:
-                        selected_cols.append(col)
-                # 添加其他列，最多10个
-                for col in kwargs['columns']:
-                    if col not in selected_cols and len(selected_cols) < 10:
-                        selected_cols.append(col)
+                self.logger.warning("列数过多(%s)，可能影响性能", len(kwargs['columns']))
+                # 保留前10个重要列：重要列优先，其余列按原顺序补齐（dict.fromkeys保序去重）
+                columns = kwargs['columns']
+                column_set = set(columns)
+                selected_cols = list(dict.fromkeys(
+                    [col for col in _IMPORTANT_COLUMNS if col in column_set] + columns
+                ))[:10]
                 kwargs['columns'] = selected_cols
-                self.logger.info(f"优化列选择: {selected_cols}") 
\ No newline at end of file
+                self.logger.info("优化列选择: %s", selected_cols) 
\ No newline at end of file
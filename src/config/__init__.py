@@ -2,6 +2,6 @@
 配置管理模块
 """
 
-from .agent_config import AgentConfig
+from .agent_config import AgentConfig, DEFAULT_MODEL_CONFIGS
 
-__all__ = ['AgentConfig'] 
\ No newline at end of file
+__all__ = ['AgentConfig', 'DEFAULT_MODEL_CONFIGS'] 
\ No newline at end of file
@@ -7,21 +7,73 @@
 @description: 智能体配置管理
 """
 
-from dataclasses import dataclass
-from typing import Dict, Any, Optional
+import re
+import sys
+from dataclasses import dataclass, field
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, FrozenSet, Mapping, Optional
 
 
-@dataclass
+# 已申请支持的模型及其建议配置（类级常量，无需实例化AgentConfig即可读取）
+# 内外两层均为只读映射，所有AgentConfig实例直接共享同一份
+DEFAULT_MODEL_CONFIGS: Mapping[str, Mapping[str, Any]] = MappingProxyType({
+    "deepseek-v3:671b": MappingProxyType({"max_context_length": 63000, "temperature": 0.0}),
+    "qwen3:235b": MappingProxyType({"max_context_length": 38000, "temperature": 0.0}),
+    "deepseek-r1:671b-0528": MappingProxyType({"max_context_length": 63000, "temperature": 0.0}),
+})
+
+# 可重试的错误关键字
+_RETRY_ERRORS = (
+    'connection error',
+    'timeout',
+    'ssl',
+    'network',
+    'rate limit',
+    'server error',
+    'service unavailable',
+    'bad gateway',
+    'gateway timeout',
+    'read timeout',
+    'write timeout',
+)
+
+
+@lru_cache(maxsize=8)
+def _context_limits(max_context_length: int, safety_ratio: float,
+                    compress_ratio: float, tool_result_ratio: float) -> Mapping[str, int]:
+    """计算上下文限制（结果只读并按参数缓存，多个实例共享同一份）"""
+    max_context_tokens = int(max_context_length * safety_ratio)
+    context_compress_threshold = int(max_context_tokens * compress_ratio)
+    max_tool_result_tokens = min(8000, int(max_context_tokens * tool_result_ratio))
+    
+    return MappingProxyType({
+        "max_context_tokens": max_context_tokens,
+        "context_compress_threshold": context_compress_threshold,
+        "max_tool_result_tokens": max_tool_result_tokens
+    })
+
+
+@dataclass(frozen=True)
 class AgentConfig:
-    """智能体配置类 - 统一管理所有配置参数"""
+    """智能体配置类 - 统一管理所有配置参数（不可变，可在并发案例间安全共享）"""
     
     # 模型相关配置
     default_model: str = "deepseek-v3:671b"
     max_iterations: int = 50
     max_model_retries: int = 5
     
+    # 过滤器相关常量（类属性，不作为dataclass字段；getter直接返回，不再每次新建列表）
+    # 成员统一驻留，与同样驻留过的字符串比较时只需比较指针
+    _SUPPORTED_FILTER_OPERATORS = frozenset(map(sys.intern, ['==', '!=', '<', '<=', '>', '>=', 'in', 'not in']))
+    _UNSUPPORTED_FILTER_OPERATORS = frozenset(map(sys.intern, ['like', 'contains', 'ilike', 'regex']))
+    _PROBLEMATIC_COLUMNS = frozenset(map(sys.intern, ['level', 'severity', 'log_level']))
+    
+    # 可重试错误匹配（预编译为一个忽略大小写的正则，一次扫描代替逐个子串查找）
+    _RETRY_ERROR_PATTERN = re.compile('|'.join(map(re.escape, _RETRY_ERRORS)), re.IGNORECASE)
+    
     # 已申请支持的模型配置
-    MODEL_CONFIGS: Dict[str, Dict[str, Any]] = None
+    MODEL_CONFIGS: Mapping[str, Mapping[str, Any]] = field(default_factory=lambda: DEFAULT_MODEL_CONFIGS)
     
     # 上下文管理配置 - 更严格的限制
     context_safety_ratio: float = 0.75  # 降低安全余量比例，从0.8改为0.75
@@ -36,8 +88,15 @@ class AgentConfig:
     
     # 重试配置
     retry_delay: float = 2.0  # 重试延迟（秒）
+    retry_cap: float = 60.0  # 指数退避的延迟上限（秒），连接/超时错误放宽到4倍
+    retry_jitter_mode: str = "decorrelated"  # 退避抖动模式: full | decorrelated | none
+    max_fallback_failures: int = 3  # 同一文件同类过滤器错误的回退连续失败次数上限，达到后暂停回退
+    fallback_cooldown_s: float = 300.0  # 回退暂停的冷却时间（秒），到期后允许再次尝试
     max_retry_attempts: int = 5  # 最大重试次数
     
+    # 并发配置
+    parallel_cases: int = 1  # 同时诊断的案例数（受模型API并发限制约束）
+    
     # Token管理配置 - 更严格的token限制
     max_token_limit: int = 6000  # 大幅降低工具数据最大token限制，从10000改为6000
     token_estimation_ratio: int = 3  # token估算比例（字符数/3）
@@ -49,51 +108,31 @@ class AgentConfig:
     # 数据路径配置
     data_base_path: str = "data"  # 基础数据目录，预处理后的数据在 data/processed_data/
     
-    def __post_init__(self):
-        """初始化后处理"""
-        if self.MODEL_CONFIGS is None:
-            self.MODEL_CONFIGS = {
-                "deepseek-v3:671b": {"max_context_length": 63000, "temperature": 0.0},
-                "qwen3:235b": {"max_context_length": 38000, "temperature": 0.0},
-                "deepseek-r1:671b-0528": {"max_context_length": 63000, "temperature": 0.0},
-            }
-    
-    def get_model_config(self, model_name: str) -> Dict[str, Any]:
+    def get_model_config(self, model_name: str) -> Mapping[str, Any]:
         """获取模型配置"""
         return self.MODEL_CONFIGS.get(model_name, self.MODEL_CONFIGS[self.default_model])
     
-    def get_context_limits(self, max_context_length: int) -> Dict[str, int]:
-        """根据模型上下文长度计算各种限制"""
-        max_context_tokens = int(max_context_length * self.context_safety_ratio)
-        context_compress_threshold = int(max_context_tokens * self.context_compress_ratio)
-        max_tool_result_tokens = min(8000, int(max_context_tokens * self.max_tool_result_ratio))
-        
-        return {
-            "max_context_tokens": max_context_tokens,
-            "context_compress_threshold": context_compress_threshold,
-            "max_tool_result_tokens": max_tool_result_tokens
-        }
+    def get_context_limits(self, max_context_length: int) -> Mapping[str, int]:
+        """根据模型上下文长度计算各种限制（返回只读映射）"""
+        return _context_limits(max_context_length, self.context_safety_ratio,
+                               self.context_compress_ratio, self.max_tool_result_ratio)
     
     def get_retry_errors(self) -> list:
         """获取可重试的错误类型"""
-        return [
-            'connection error',
-            'timeout',
-            'ssl',
-            'network',
-            'rate limit',
-            'server error',
-            'service unavailable',
-            'bad gateway',
-            'gateway timeout',
-            'read timeout',
-            'write timeout'
-        ]
-    
-    def get_supported_filter_operators(self) -> list:
+        return list(_RETRY_ERRORS)
+    
+    def is_retryable_error(self, error_msg: str) -> bool:
+        """判断错误信息是否包含可重试的错误关键字（忽略大小写）"""
+        return self._RETRY_ERROR_PATTERN.search(error_msg) is not None
+    
+    def get_supported_filter_operators(self) -> FrozenSet[str]:
         """获取支持的过滤操作符"""
-        return ['==', '!=', '<', '<=', '>', '>=', 'in', 'not in']
+        return self._SUPPORTED_FILTER_OPERATORS
+    
+    def get_unsupported_filter_operators(self) -> FrozenSet[str]:
+        """获取明确不支持（需跳过过滤器）的过滤操作符"""
+        return self._UNSUPPORTED_FILTER_OPERATORS
     
-    def get_problematic_columns(self) -> list:
+    def get_problematic_columns(self) -> FrozenSet[str]:
         """获取可能有问题的列名"""
-        return ['level', 'severity', 'log_level'] 
\ No newline at end of file
+        return self._PROBLEMATIC_COLUMNS 
\ No newline at end of file
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: claude89757
+@date: 2025-07-12
+@description: 大模型响应缓存 - 确定性调用的精确匹配缓存（内存LRU热层 + 可选磁盘冷层）及可选的语义近似缓存
+"""
+
+import os
+import json
+import hashlib
+import threading
+import importlib.util
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy仅语义缓存需要
+    np = None
+
+try:
+    import faiss
+except ImportError:  # faiss为可选依赖，未安装时语义缓存使用numpy矩阵乘法检索
+    faiss = None
+
+try:
+    import diskcache
+except ImportError:  # diskcache为可选依赖，未安装时磁盘冷层按键分文件存储
+    diskcache = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack为可选依赖，未安装时磁盘冷层使用JSON序列化
+    msgpack = None
+
+# 使用faiss检索时取回的候选数（候选中没有同模型条目时回退到全量扫描）
+_FAISS_TOP_K = 16
+
+# 语义缓存持久化时每新增多少条目写一次盘
+_SEMANTIC_SAVE_INTERVAL = 64
+
+# 响应缓存整文件持久化时每新增多少条目写一次盘（其余在 save()/close() 时写入）
+_CACHE_SAVE_INTERVAL = 64
+
+# 磁盘冷层默认容量上限（字节，仅diskcache支持按容量淘汰）
+_DEFAULT_DISK_SIZE_LIMIT = 5 * 1024 ** 3
+
+
+def _pack(entry: Dict[str, Any]) -> bytes:
+    """序列化缓存条目（msgpack比JSON更小更快）"""
+    if msgpack is not None:
+        return msgpack.packb(entry, use_bin_type=True)
+    return json.dumps(entry, ensure_ascii=False).encode('utf-8')
+
+
+def _unpack(raw: bytes) -> Dict[str, Any]:
+    """反序列化缓存条目"""
+    if msgpack is not None:
+        return msgpack.unpackb(raw, raw=False)
+    return json.loads(raw)
+
+
+class _DiskTier:
+    """磁盘冷层：安装了diskcache时使用其SQLite索引的缓存，否则每个键一个文件"""
+    
+    def __init__(self, directory: str, size_limit: int = _DEFAULT_DISK_SIZE_LIMIT):
+        self.directory = directory
+        if diskcache is not None:
+            self._cache = diskcache.Cache(directory, size_limit=size_limit)
+        else:
+            self._cache = None
+            os.makedirs(directory, exist_ok=True)
+        # 序列化格式写入文件后缀，切换格式后旧文件不会被误读
+        self._suffix = '.msgpack' if msgpack is not None else '.json'
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + self._suffix)
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取条目，不存在或无法解析时返回None"""
+        try:
+            if self._cache is not None:
+                raw = self._cache.get(key)
+                if raw is None:
+                    return None
+            else:
+                with open(self._path(key), 'rb') as f:
+                    raw = f.read()
+            return _unpack(raw)
+        except Exception:
+            return None
+    
+    def set(self, key: str, entry: Dict[str, Any]):
+        """写入条目（分文件存储时先写临时文件再替换）"""
+        raw = _pack(entry)
+        if self._cache is not None:
+            self._cache.set(key, raw)
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(raw)
+        os.replace(tmp_path, path)
+
+
+class LLMCache:
+    """
+    按请求内容精确匹配的大模型响应缓存（线程安全）
+    
+    内存LRU为热层；指定 disk_dir 时所有条目同时写入磁盘冷层，热层未命中时从冷层读取并提升回热层，
+    长时间运行的进程不会因缓存增长而耗尽内存
+    """
+    
+    def __init__(self, max_entries: int = 10000, persist_path: Optional[str] = None,
+                 disk_dir: Optional[str] = None, disk_size_limit: int = _DEFAULT_DISK_SIZE_LIMIT):
+        """
+        初始化缓存
+        
+        Args:
+            max_entries: 内存中最多保留的条目数，超出后淘汰最久未使用的条目
+            persist_path: 磁盘持久化文件路径（如 .cache/llm_responses.json），为None时仅使用内存
+            disk_dir: 磁盘冷层目录（如 .cache/llm_responses），为None时不启用冷层
+            disk_size_limit: 冷层容量上限（字节，需安装diskcache）
+        """
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # 串行化整文件写盘，写盘期间不阻塞缓存读写
+        self._unsaved = 0  # 上次写盘后新增的条目数
+        self._disk = _DiskTier(disk_dir, disk_size_limit) if disk_dir else None
+        
+        if persist_path and os.path.exists(persist_path):
+            self._load()
+    
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, Any]], temperature: Optional[float],
+                 max_tokens: Optional[int]) -> str:
+        """根据模型、消息列表和生成参数计算缓存键（紧凑JSON + BLAKE2b-128，非对抗场景下碰撞概率可忽略）"""
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+            sort_keys=True, ensure_ascii=False, separators=(',', ':')
+        )
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查询缓存，命中时返回 {"content", "reasoning", "usage"}"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if self._disk is None:
+            return None
+        
+        # 热层未命中时查询冷层（磁盘读取不持有锁），命中后提升到热层
+        entry = self._disk.get(key)
+        if entry is not None:
+            with self._lock:
+                self._insert(key, entry)
+        return entry
+    
+    def put(self, key: str, content: str, reasoning: str = "", usage: Optional[Dict[str, int]] = None):
+        """写入缓存；启用冷层时同步写入该条目，启用整文件持久化时每新增一批条目写一次盘"""
+        entry = {"content": content, "reasoning": reasoning, "usage": usage}
+        with self._lock:
+            self._insert(key, entry)
+            self._unsaved += 1
+            save_due = bool(self.persist_path) and self._unsaved >= _CACHE_SAVE_INTERVAL
+        if self._disk is not None:
+            self._disk.set(key, entry)
+        if save_due:
+            self.save()
+    
+    def save(self):
+        """将内存中的条目写入持久化文件（未启用持久化或没有新条目时不做任何事）"""
+        if not self.persist_path:
+            return
+        with self._save_lock:
+            # 只在复制快照时持有缓存锁，序列化和写盘期间其他线程照常读写
+            with self._lock:
+                if not self._unsaved:
+                    return
+                snapshot = dict(self._entries)
+                self._unsaved = 0
+            self._save(snapshot)
+    
+    def _insert(self, key: str, entry: Dict[str, Any]):
+        """写入热层并淘汰超出容量的条目，调用方需持有锁"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        """清空内存中的缓存（磁盘冷层保留）"""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def _load(self):
+        """从磁盘加载缓存，文件损坏时忽略"""
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict):
+            for key, entry in list(data.items())[-self.max_entries:]:
+                self._entries[key] = entry
+    
+    def _save(self, entries: Dict[str, Dict[str, Any]]):
+        """原子写入磁盘（先写临时文件再替换），调用方需持有写盘锁"""
+        directory = os.path.dirname(self.persist_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.persist_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.persist_path)
+
+
+class SemanticCache:
+    """
+    基于句向量余弦相似度的近似匹配缓存（线程安全）
+    
+    对措辞略有不同但语义几乎相同的请求复用已有回答。向量模型（sentence-transformers）
+    在首次使用时才加载；所有向量归一化后存放在一个 (N, d) 矩阵中，查询只需一次矩阵-向量乘法。
+    安装了faiss时额外维护一个内积索引（IndexFlatIP），由其SIMD内核完成检索。
+    
+    指定 persist_dir 时向量矩阵保存为单个 .npy 文件，启动时以内存映射方式加载，无需重新计算向量。
+    """
+    
+    DEFAULT_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+    EMBEDDINGS_FILE = 'embeddings.npy'
+    ENTRIES_FILE = 'entries.json'
+    
+    def __init__(self, threshold: float = 0.95, max_entries: int = 5000,
+                 model_name: str = DEFAULT_MODEL_NAME, persist_dir: Optional[str] = None):
+        """
+        初始化语义缓存
+        
+        Args:
+            threshold: 命中所需的最低余弦相似度（技术类内容建议不低于0.95）
+            max_entries: 最多保留的条目数，超出后淘汰最久未使用的条目
+            model_name: sentence-transformers 向量模型名称
+            persist_dir: 持久化目录（如 .cache/semantic），为None时仅使用内存
+        """
+        if np is None:
+            raise ImportError("语义缓存需要安装 numpy")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.model_name = model_name
+        self._embedder = None
+        self._lock = threading.Lock()
+        
+        # 各条目的向量、所属模型编号、最近使用时间和缓存内容（按行对齐）
+        self._embeddings: Optional["np.ndarray"] = None
+        self._model_ids = np.empty(0, dtype=np.int32)
+        self._last_used = np.empty(0, dtype=np.int64)
+        self._responses: List[Dict[str, Any]] = []
+        self._model_codes: Dict[str, int] = {}
+        self._clock = 0
+        self._index = None  # faiss内积索引，行号与上面各数组一致
+        
+        self.persist_dir = persist_dir
+        self._unsaved = 0  # 上次写盘后新增的条目数
+        if persist_dir:
+            self._load()
+    
+    @staticmethod
+    def is_available() -> bool:
+        """检查依赖是否已安装（不实际导入sentence-transformers，避免加载torch）"""
+        return np is not None and importlib.util.find_spec('sentence_transformers') is not None
+    
+    @staticmethod
+    def prompt_text(messages: List[Dict[str, Any]]) -> str:
+        """拼接参与语义匹配的系统提示和用户消息"""
+        return "\n".join(
+            str(message.get("content", "")) for message in messages
+            if message.get("role") in ("system", "user")
+        )
+    
+    def _get_embedder(self):
+        """首次使用时加载向量模型"""
+        if self._embedder is None:
+            from sentence_transformers import SentenceTransformer
+            self._embedder = SentenceTransformer(self.model_name)
+        return self._embedder
+    
+    def embed(self, text: str) -> "np.ndarray":
+        """计算归一化后的句向量"""
+        return np.asarray(self._get_embedder().encode(text, normalize_embeddings=True), dtype=np.float32)
+    
+    def get(self, model: str, query: "np.ndarray") -> Optional[Dict[str, Any]]:
+        """查询与给定向量最相似的同模型条目，相似度达到阈值时返回 {"content", "reasoning", "usage"}"""
+        with self._lock:
+            code = self._model_codes.get(model)
+            if code is None or self._embeddings is None:
+                return None
+            best = self._search_index(code, query) if self._index is not None else -1
+            if best == -1:
+                similarities = self._embeddings @ query
+                similarities[self._model_ids != code] = -1.0
+                best = int(np.argmax(similarities))
+                if similarities[best] < self.threshold:
+                    return None
+            elif best is None:
+                return None
+            self._clock += 1
+            self._last_used[best] = self._clock
+            return self._responses[best]
+    
+    def put(self, model: str, query: "np.ndarray", content: str, reasoning: str = "",
+            usage: Optional[Dict[str, int]] = None):
+        """写入一条缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            code = self._model_codes.setdefault(model, len(self._model_codes))
+            self._clock += 1
+            row = query.reshape(1, -1)
+            self._embeddings = row if self._embeddings is None else np.concatenate((self._embeddings, row))
+            self._model_ids = np.append(self._model_ids, code)
+            self._last_used = np.append(self._last_used, self._clock)
+            self._responses.append({"content": content, "reasoning": reasoning, "usage": usage})
+            if faiss is not None:
+                if self._index is None:
+                    self._index = faiss.IndexFlatIP(row.shape[1])
+                self._index.add(row)
+            
+            while len(self._responses) > self.max_entries:
+                oldest = int(np.argmin(self._last_used))
+                if self._index is not None:
+                    # IndexFlat删除后会压缩行号，与np.delete保持一致
+                    self._index.remove_ids(np.array([oldest], dtype=np.int64))
+                self._embeddings = np.delete(self._embeddings, oldest, axis=0)
+                self._model_ids = np.delete(self._model_ids, oldest)
+                self._last_used = np.delete(self._last_used, oldest)
+                del self._responses[oldest]
+            
+            self._unsaved += 1
+            if self.persist_dir and self._unsaved >= _SEMANTIC_SAVE_INTERVAL:
+                self._save()
+    
+    def save(self):
+        """将尚未写盘的条目写入持久化目录（未启用持久化时不做任何事）"""
+        with self._lock:
+            if self.persist_dir and self._unsaved:
+                self._save()
+    
+    def _load(self):
+        """从持久化目录加载（向量矩阵以内存映射方式打开），文件缺失、损坏或不一致时忽略"""
+        embeddings_path = os.path.join(self.persist_dir, self.EMBEDDINGS_FILE)
+        entries_path = os.path.join(self.persist_dir, self.ENTRIES_FILE)
+        try:
+            embeddings = np.load(embeddings_path, mmap_mode='r')
+            with open(entries_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            model_ids = np.asarray(entries["model_ids"], dtype=np.int32)
+            last_used = np.asarray(entries["last_used"], dtype=np.int64)
+            responses = entries["responses"]
+            model_codes = entries["model_codes"]
+            clock = entries["clock"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        if embeddings.ndim != 2 or not (len(embeddings) == len(model_ids) == len(last_used) == len(responses)):
+            return
+        
+        self._embeddings = embeddings
+        self._model_ids = model_ids
+        self._last_used = last_used
+        self._responses = responses
+        self._model_codes = model_codes
+        self._clock = clock
+        if faiss is not None and len(responses):
+            self._index = faiss.IndexFlatIP(embeddings.shape[1])
+            self._index.add(np.ascontiguousarray(embeddings))
+    
+    def _save(self):
+        """原子写入向量矩阵和条目信息（先写临时文件再替换），调用方需持有锁"""
+        if self._embeddings is None:
+            return
+        os.makedirs(self.persist_dir, exist_ok=True)
+        embeddings_path = os.path.join(self.persist_dir, self.EMBEDDINGS_FILE)
+        entries_path = os.path.join(self.persist_dir, self.ENTRIES_FILE)
+        
+        with open(f"{embeddings_path}.tmp", 'wb') as f:
+            np.save(f, self._embeddings)
+        with open(f"{entries_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({
+                "model_codes": self._model_codes,
+                "model_ids": self._model_ids.tolist(),
+                "last_used": self._last_used.tolist(),
+                "responses": self._responses,
+                "clock": self._clock,
+            }, f, ensure_ascii=False)
+        os.replace(f"{embeddings_path}.tmp", embeddings_path)
+        os.replace(f"{entries_path}.tmp", entries_path)
+        self._unsaved = 0
+    
+    def _search_index(self, code: int, query: "np.ndarray") -> Optional[int]:
+        """
+        用faiss索引检索，调用方需持有锁
+        
+        Returns:
+            命中的行号；确定未命中时返回None；候选不足以判断时返回-1（需回退到全量扫描）
+        """
+        k = min(_FAISS_TOP_K, len(self._responses))
+        scores, rows = self._index.search(query.reshape(1, -1), k)
+        for score, row in zip(scores[0], rows[0]):
+            if row < 0 or score < self.threshold:
+                # 结果按相似度降序排列，之后的候选都低于阈值
+                return None
+            if self._model_ids[row] == code:
+                return int(row)
+        return -1 if k < len(self._responses) else None
+    
+    def __len__(self) -> int:
+        return len(self._responses)
@@ -2,6 +2,6 @@
 日志系统模块
 """
 
-from .logger_setup import LoggerSetup
+from .logger_setup import LoggerSetup, LazyJSON
 
-__all__ = ['LoggerSetup'] 
\ No newline at end of file
+__all__ = ['LoggerSetup', 'LazyJSON'] 
\ No newline at end of file
@@ -8,16 +8,69 @@
 """
 
 import os
+import atexit
+import queue
 import logging
-import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from datetime import datetime
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Any
+
+try:
+    from ..utils import json_utils
+except ImportError:
+    # model.py 会把 src 目录加入 sys.path 并以顶层包 log_system 导入本模块
+    from utils import json_utils
+
+
+class _RoutingHandler(logging.Handler):
+    """在监听线程中按记录所属的logger名称分发到对应的文件处理器"""
+    
+    def __init__(self):
+        super().__init__()
+        self.targets: Dict[str, logging.Handler] = {}
+    
+    def register(self, name: str, handler: logging.Handler):
+        """登记logger对应的文件处理器"""
+        self.targets[name] = handler
+    
+    def emit(self, record: logging.LogRecord):
+        target = self.targets.get(record.name)
+        if target is not None and record.levelno >= target.level:
+            target.handle(record)
+
+
+class LazyJSON:
+    """延迟JSON序列化 - 仅在日志记录真正被写出时才执行json.dumps"""
+    
+    __slots__ = ('data',)
+    
+    def __init__(self, data: Any):
+        self.data = data
+    
+    def __str__(self) -> str:
+        return json_utils.dumps(self.data, indent=True)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """不在调用线程中格式化消息，格式化（包括LazyJSON序列化）交给监听线程完成"""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
 
 
 class LoggerSetup:
     """日志系统配置类"""
     
+    # 所有文件日志共用一个队列和一个后台监听线程，调用方只做入队，不阻塞在磁盘I/O上
+    _log_queue: "queue.Queue" = queue.Queue(-1)
+    _routing_handler = _RoutingHandler()
+    _listener: QueueListener = None
+    
+    # 单个日志文件的大小上限及保留的轮转文件数，避免长时间批量诊断写出超大日志
+    _MAX_LOG_BYTES = 10 * 1024 * 1024
+    _LOG_BACKUP_COUNT = 3
+    
     def __init__(self, base_dir: str = "src/logs"):
         self.base_dir = Path(base_dir)
         self.setup_directories()
@@ -85,6 +138,14 @@ class LoggerSetup:
             level=logging.INFO
         )
     
+    @classmethod
+    def _ensure_listener(cls):
+        """按需启动后台日志监听线程，进程退出时自动停止并写完剩余记录"""
+        if cls._listener is None:
+            cls._listener = QueueListener(cls._log_queue, cls._routing_handler)
+            cls._listener.start()
+            atexit.register(cls._listener.stop)
+    
     def _create_logger(self, name: str, log_file: Path, level=logging.INFO):
         """创建单个日志记录器"""
         logger = logging.getLogger(name)
@@ -95,15 +156,16 @@ class LoggerSetup:
             return logger
             
         # 文件处理器 - 总是使用指定级别记录到文件
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        # delay=True: 首条记录写出时才打开文件，未使用的日志类别（如无错误案例的错误日志）不产生文件
+        file_handler = RotatingFileHandler(
+            log_file,
+            maxBytes=self._MAX_LOG_BYTES,
+            backupCount=self._LOG_BACKUP_COUNT,
+            encoding='utf-8',
+            delay=True
+        )
         file_handler.setLevel(level)
         
-        # 控制台处理器 - 设置为最高级别，让所有日志都只记录到文件
-        console_handler = logging.StreamHandler(sys.stdout)
-        # 设置为CRITICAL级别，这样日志信息不会在控制台显示
-        # 所有详细信息都记录到文件中
-        console_handler.setLevel(logging.CRITICAL + 1)  # 设置为超过CRITICAL的级别，不显示任何日志
-        
         # 格式器 - 对于LLM交互日志使用更简洁的格式
         if name == 'llm_interactions':
             formatter = logging.Formatter(
@@ -117,13 +179,26 @@ class LoggerSetup:
             )
         
         file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
         
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        # 文件处理器由后台监听线程调用，logger上只挂队列处理器
+        self._routing_handler.register(name, file_handler)
+        queue_handler = _DeferredQueueHandler(self._log_queue)
+        queue_handler.setLevel(level)
+        self._ensure_listener()
+        
+        logger.addHandler(queue_handler)
+        # 所有日志只记录到文件，不向上传播到根logger，因此无需挂载屏蔽输出的控制台处理器
+        logger.propagate = False
         
         return logger
     
+    def flush(self):
+        """阻塞直到已入队的日志记录全部由后台线程写入文件"""
+        for logger in self.loggers.values():
+            for handler in logger.handlers:
+                if isinstance(handler, QueueHandler):
+                    handler.queue.join()
+    
     def create_case_error_logger(self, uuid: str):
         """为特定案例创建错误日志记录器"""
         case_error_file = self.base_dir / "errors" / f"case_{uuid}_error.log"
@@ -8,20 +8,185 @@
 """
 
 import os
-import openai
-import json
+import re
 import time
-import asyncio
-from datetime import datetime
+import logging
+import functools
+import threading
+import importlib.util
 from typing import List, Dict, Any, Optional, Union, Callable
-from dataclasses import dataclass, field
+from dataclasses import dataclass
+
+try:
+    from .llm_cache import LLMCache, SemanticCache
+    from .prefix_cache import PrefixCache
+    from .utils import json_utils
+except ImportError:
+    # 以脚本方式运行时 src 目录即为 sys.path[0]
+    from llm_cache import LLMCache, SemanticCache
+    from prefix_cache import PrefixCache
+    from utils import json_utils
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken为可选依赖，未安装时不做请求前的上下文长度检查
+    tiktoken = None
+
+
+# 思考类型模型（R1、qwen3等）名称关键字匹配，忽略大小写
+_REASONING_MODEL_PATTERN = re.compile(r'r1|qwen3|reasoner', re.IGNORECASE)
+
+# 思考类型模型未指定max_tokens时的默认输出上限（含思考过程），按名称子串依次匹配，靠前的优先
+# 匹配前模型名中的 ':' 统一为 '-'（如 qwen3:235b 与 qwen3-235b 视为同一模型）
+_REASONING_CAPS = (
+    ('qwen3-235b', 65536),
+    ('qwen3', 32768),
+    ('r1', 32768),
+    ('reasoner', 32768),
+)
+
+# 未匹配到上表时的默认输出上限
+_DEFAULT_MAX_OUT = 8192
+
+# 调试输出请求消息时最多展示的（最近）消息条数，避免长对话整段输出
+_DEBUG_MAX = 50
+
+# 已知模型的上下文窗口（tokens），按名称子串匹配；未列出的模型不做请求前检查
+_MODEL_CONTEXT_WINDOWS = (
+    ('deepseek-v3', 64000),
+    ('deepseek-r1', 64000),
+    ('qwen3', 128000),
+)
+
+# 每条消息的角色、分隔符等格式开销（tokens）
+_TOKENS_PER_MESSAGE = 4
+
+
+class ContextOverflowError(ValueError):
+    """请求消息本身已超出模型上下文窗口（在本地检查出，未发送请求）"""
+
+
+@functools.lru_cache(maxsize=128)
+def _is_reasoning_model(model: str) -> bool:
+    """按模型名称判断是否是思考类型模型（结果按名称缓存）"""
+    return _REASONING_MODEL_PATTERN.search(model) is not None
+
+
+@functools.lru_cache(maxsize=128)
+def _max_out(model: str) -> int:
+    """思考类型模型的默认max_tokens（结果按名称缓存）"""
+    name = model.lower().replace(':', '-')
+    for keyword, cap in _REASONING_CAPS:
+        if keyword in name:
+            return cap
+    return _DEFAULT_MAX_OUT
+
+
+@functools.lru_cache(maxsize=128)
+def _context_window(model: str) -> Optional[int]:
+    """按模型名称查找上下文窗口大小（结果按名称缓存），未知模型返回None"""
+    name = model.lower()
+    for keyword, window in _MODEL_CONTEXT_WINDOWS:
+        if keyword in name:
+            return window
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def _token_encoding():
+    """加载tiktoken编码器（只加载一次；未安装或无法加载编码文件时返回None）"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception:
+        return None
+
+
+def _count_message_tokens(encoding, messages: List[Dict[str, Any]]) -> int:
+    """统计消息列表的输入token数（不同模型分词器不同，结果为近似值）"""
+    return sum(
+        len(encoding.encode_ordinary(str(message.get("content") or ""))) for message in messages
+    ) + _TOKENS_PER_MESSAGE * len(messages)
+
+
+@functools.lru_cache(maxsize=1)
+def _http_client_options() -> Dict[str, Any]:
+    """HTTP客户端的连接池配置（首次创建客户端时才导入httpx）"""
+    import httpx
+    return {
+        # 安装了h2时启用HTTP/2，并发请求可在同一连接上多路复用
+        "http2": importlib.util.find_spec('h2') is not None,
+        # 复用长连接，避免每次请求重新进行TCP+TLS握手
+        "limits": httpx.Limits(max_keepalive_connections=32, max_connections=64, keepalive_expiry=60),
+        # 读超时与openai默认值保持一致，思考类型模型的长回答可能需要数分钟
+        "timeout": httpx.Timeout(connect=10, read=600, write=30, pool=5),
+    }
+
+
+@dataclass
+class _ChatRequest:
+    """一次对话请求的准备结果（同步与异步接口共用）"""
+    model: str
+    is_reasoning_model: bool
+    formatted_messages: List[Dict[str, str]]
+    api_params: Dict[str, Any]
+    cache_key: Optional[str] = None
+    semantic_query: Any = None  # 语义缓存的查询向量
+    prefix_cache_path: Optional[str] = None  # 前缀磁盘缓存的文件路径
+    cached: Optional[Dict[str, Any]] = None  # 命中的缓存结果
+
+
+@dataclass
+class ChatResult:
+    """从API响应中一次性提取的结果，后续处理只读取这些字段而不再遍历响应对象"""
+    # 兼容Python 3.9（dataclass的slots参数需3.10+），手动声明__slots__
+    __slots__ = ('content', 'reasoning', 'prompt_tokens', 'completion_tokens', 'total_tokens', 'duration')
+    content: str
+    reasoning: str
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    duration: float
+    
+    @classmethod
+    def from_parts(cls, content: str, reasoning: str, usage) -> "ChatResult":
+        """由回答、思考过程和API返回的usage对象（可能为None）构造，耗时稍后填入"""
+        if usage:
+            return cls(content, reasoning, usage.prompt_tokens, usage.completion_tokens, usage.total_tokens, 0.0)
+        return cls(content, reasoning, 0, 0, 0, 0.0)
+    
+    def usage_info(self) -> Optional[Dict[str, int]]:
+        """token用量字典（API未返回用量时为None）"""
+        if not self.total_tokens:
+            return None
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+        }
 
 
 class ModelClient:
     """OpenAI-API-Compatible 模型客户端"""
     
-    def __init__(self):
-        """初始化模型客户端，从环境变量获取配置"""
+    def __init__(self, enable_cache: bool = True, cache_path: Optional[str] = None,
+                 enable_semantic_cache: bool = False, semantic_threshold: float = 0.95,
+                 prefix_cache_dir: Optional[str] = None, cache_disk_dir: Optional[str] = None,
+                 semantic_cache_dir: Optional[str] = None):
+        """
+        初始化模型客户端，从环境变量获取配置
+        
+        Args:
+            enable_cache: 是否启用确定性调用的响应缓存
+            cache_path: 响应缓存的磁盘持久化路径（如 .cache/llm_responses.json），为None时仅缓存在内存
+            enable_semantic_cache: 是否启用语义近似缓存（需安装sentence-transformers；
+                                   回答可能依赖UUID等细节，默认关闭以避免误命中）
+            semantic_threshold: 语义缓存命中所需的最低余弦相似度
+            prefix_cache_dir: 以系统提示开头的请求的磁盘缓存目录（如 .cache/llm），为None时不启用
+            cache_disk_dir: 响应缓存的磁盘冷层目录（如 .cache/llm_responses），内存中淘汰的条目仍可从磁盘命中
+            semantic_cache_dir: 语义缓存的持久化目录（如 .cache/semantic），为None时仅缓存在内存
+        """
         self.api_key = os.getenv('OPENAI_API_TOKEN')
         self.base_url = os.getenv('BASE_URL')
         
@@ -30,11 +195,23 @@ class ModelClient:
         if not self.base_url:
             raise ValueError("环境变量 BASE_URL 未设置")
         
-        # 初始化 OpenAI 客户端
-        self.client = openai.OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
-        )
+        # OpenAI 客户端在首次使用时才导入openai并创建（见 client / async_client 属性）
+        self._client = None
+        self._async_client = None
+        self._http = None
+        self._async_http = None
+        self._client_lock = threading.Lock()
+        self._models = None  # 模型列表（首次查询后缓存，见 refresh_models）
+        
+        # 响应缓存（相同模型、消息和生成参数的确定性调用直接复用结果）
+        self.cache = LLMCache(persist_path=cache_path, disk_dir=cache_disk_dir) if enable_cache else None
+        self.prefix_cache = PrefixCache(prefix_cache_dir) if prefix_cache_dir else None
+        self.semantic_cache = None
+        if enable_semantic_cache:
+            if SemanticCache.is_available():
+                self.semantic_cache = SemanticCache(threshold=semantic_threshold, persist_dir=semantic_cache_dir)
+            else:
+                print("⚠️ 未安装 sentence-transformers，语义缓存未启用")
         
         # 尝试设置调试日志记录器（如果日志系统可用）
         try:
@@ -49,6 +226,53 @@ class ModelClient:
         except (ImportError, Exception):
             self._debug_logger = None
     
+    @property
+    def client(self):
+        """同步 OpenAI 客户端（使用共享连接池的HTTP客户端，首次访问时创建）"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import httpx
+                    import openai
+                    self._http = httpx.Client(**_http_client_options())
+                    self._client = openai.OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        http_client=self._http
+                    )
+        return self._client
+    
+    @property
+    def async_client(self):
+        """异步 OpenAI 客户端（供 achat / chat_many 并发请求使用，首次访问时创建）"""
+        if self._async_client is None:
+            with self._client_lock:
+                if self._async_client is None:
+                    import httpx
+                    import openai
+                    self._async_http = httpx.AsyncClient(**_http_client_options())
+                    self._async_client = openai.AsyncOpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        http_client=self._async_http
+                    )
+        return self._async_client
+    
+    def close(self):
+        """关闭HTTP连接池并保存响应缓存与语义缓存（同步客户端立即关闭，异步客户端需在事件循环中关闭，见 aclose）"""
+        if self.cache is not None:
+            self.cache.save()
+        if self.semantic_cache is not None:
+            self.semantic_cache.save()
+        if self._http is not None:
+            self._http.close()
+    
+    async def aclose(self):
+        """关闭同步与异步HTTP连接池"""
+        self.close()
+        if self._async_http is not None:
+            await self._async_http.aclose()
+    
     def chat(self, 
             messages: Union[List[Dict[str, str]], str],
             model: str = "deepseek-v3:671b",
@@ -57,7 +281,10 @@ class ModelClient:
             system_prompt: Optional[str] = None,
             debug: bool = False,
             return_full_response: bool = False,
-            return_reasoning: bool = False) -> Union[str, Dict[str, Any], tuple[str, str]]:
+            return_reasoning: bool = False,
+            use_cache: Optional[bool] = None,
+            stream: bool = False,
+            on_chunk: Optional[Callable[[str], None]] = None) -> Union[str, Dict[str, Any], tuple[str, str]]:
         """
         简化的对话接口 - 主要使用函数，支持思考类型模型
         
@@ -70,12 +297,117 @@ class ModelClient:
             debug: 是否显示调试信息
             return_full_response: 是否返回完整响应
             return_reasoning: 是否返回思考过程（仅R1类模型有效）
+            use_cache: 是否使用响应缓存；默认仅在temperature为0或思考类型模型时使用，
+                       return_full_response=True 时不读取缓存
+            stream: 是否流式接收回答，边生成边处理（不支持与return_full_response同时使用）
+            on_chunk: 流式模式下每收到一段回答文本时的回调（命中缓存时以完整回答调用一次）
         
         Returns:
             - 默认: 模型回复文本
             - return_full_response=True: 完整API响应
             - return_reasoning=True: (思考过程, 最终回答) 元组
         """
+        if stream and return_full_response:
+            raise ValueError("流式模式不支持 return_full_response")
+        
+        request = self._prepare_chat(messages, model, temperature, max_tokens, system_prompt,
+                                     debug, return_full_response, use_cache, stream)
+        if request.cached is not None:
+            if stream and on_chunk is not None and request.cached["content"]:
+                on_chunk(request.cached["content"])
+            return self._cached_result(request.cached, debug, return_reasoning)
+        
+        try:
+            # 仅在需要输出调用耗时（调试或日志）时计时
+            timed = debug or self._debug_logger is not None
+            start_time = time.perf_counter() if timed else 0.0
+            response = self._invoke(**request.api_params)
+            if stream:
+                result = self._consume_stream(response, on_chunk)
+                response = None
+            else:
+                result = self._extract_response(response)
+            if timed:
+                result.duration = time.perf_counter() - start_time
+            return self._finish_chat(request, response, result, debug, return_full_response, return_reasoning)
+        except Exception as e:
+            self._log_api_error(e, debug)
+            raise
+    
+    async def achat(self,
+                    messages: Union[List[Dict[str, str]], str],
+                    model: str = "deepseek-v3:671b",
+                    temperature: float = 0.5,
+                    max_tokens: Optional[int] = None,
+                    system_prompt: Optional[str] = None,
+                    debug: bool = False,
+                    return_full_response: bool = False,
+                    return_reasoning: bool = False,
+                    use_cache: Optional[bool] = None) -> Union[str, Dict[str, Any], tuple[str, str]]:
+        """
+        异步对话接口，参数与返回值同 chat()
+        """
+        request = self._prepare_chat(messages, model, temperature, max_tokens, system_prompt,
+                                     debug, return_full_response, use_cache)
+        if request.cached is not None:
+            return self._cached_result(request.cached, debug, return_reasoning)
+        
+        try:
+            timed = debug or self._debug_logger is not None
+            start_time = time.perf_counter() if timed else 0.0
+            response = await self._ainvoke(**request.api_params)
+            result = self._extract_response(response)
+            if timed:
+                result.duration = time.perf_counter() - start_time
+            return self._finish_chat(request, response, result, debug, return_full_response, return_reasoning)
+        except Exception as e:
+            self._log_api_error(e, debug)
+            raise
+    
+    async def chat_many(self,
+                        prompt_list: List[Union[List[Dict[str, str]], str]],
+                        concurrency: int = 8,
+                        **kwargs) -> List[Union[str, Dict[str, Any], tuple[str, str]]]:
+        """
+        并发执行多个相互独立的对话请求
+        
+        Args:
+            prompt_list: 每个元素为一次请求的消息列表或单个字符串
+            concurrency: 同时进行的最大请求数
+            **kwargs: 传给 achat() 的其他参数
+        
+        Returns:
+            按输入顺序排列的结果列表（任一请求失败时抛出其异常）
+        """
+        import asyncio  # 仅并发接口需要，延迟导入以缩短模块加载时间
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def _one(prompt):
+            async with semaphore:
+                return await self.achat(prompt, **kwargs)
+        
+        return await asyncio.gather(*(_one(prompt) for prompt in prompt_list))
+    
+    def _invoke(self, **api_params):
+        """发送 chat.completions 请求的唯一同步入口，所有对话接口都经由此处调用API"""
+        return self.client.chat.completions.create(**api_params)
+    
+    async def _ainvoke(self, **api_params):
+        """发送 chat.completions 请求的唯一异步入口"""
+        return await self.async_client.chat.completions.create(**api_params)
+    
+    def _prepare_chat(self,
+                      messages: Union[List[Dict[str, str]], str],
+                      model: str,
+                      temperature: float,
+                      max_tokens: Optional[int],
+                      system_prompt: Optional[str],
+                      debug: bool,
+                      return_full_response: bool,
+                      use_cache: Optional[bool],
+                      stream: bool = False) -> "_ChatRequest":
+        """组装请求消息和API参数，记录请求信息并查询响应缓存"""
         # 检测是否是思考类型模型（R1、qwen3等）
         is_reasoning_model = self.is_reasoning_model(model)
         
@@ -83,7 +415,8 @@ class ModelClient:
         if isinstance(messages, str):
             formatted_messages = [{"role": "user", "content": messages}]
         else:
-            formatted_messages = messages.copy()
+            # 不修改调用方的列表：添加系统提示时通过拼接生成新列表，无需预先复制
+            formatted_messages = messages
         
         # 添加系统提示（R1类模型不建议使用）
         if system_prompt:
@@ -94,7 +427,7 @@ class ModelClient:
                     self._debug_logger.warning(warning_msg)
                 if debug:
                     print(warning_msg)
-            formatted_messages.insert(0, {"role": "system", "content": system_prompt})
+            formatted_messages = [{"role": "system", "content": system_prompt}] + formatted_messages
         
         # 始终记录请求信息到日志，无论是否debug
         if hasattr(self, '_debug_logger') and self._debug_logger:
@@ -103,7 +436,9 @@ class ModelClient:
             self._debug_logger.info(f"温度: {temperature}")
             self._debug_logger.info(f"最大Token: {max_tokens or '默认'}")
             self._debug_logger.info(f"消息数量: {len(formatted_messages)}")
-            self._debug_logger.debug(f"请求消息:\n{json.dumps(formatted_messages, ensure_ascii=False, indent=2)}")
+            # 日志级别高于DEBUG时不序列化消息
+            if self._debug_logger.isEnabledFor(logging.DEBUG):
+                self._debug_logger.debug("请求消息:\n%s", self._debug_dump(formatted_messages))
         
         # 控制台调试信息（仅在debug模式显示）
         if debug:
@@ -114,98 +449,219 @@ class ModelClient:
                 if max_tokens:
                     print(f"[调试] 最大Token: {max_tokens} (包含思考过程)")
                 else:
-                    print(f"[调试] 最大Token: 32K (默认，包含思考过程)")
+                    print(f"[调试] 最大Token: {_max_out(model)} (默认，包含思考过程)")
             else:
                 print(f"[调试] 温度: {temperature}")
                 print(f"[调试] 最大Token: {max_tokens or '默认'}")
             print(f"[调试] 消息数量: {len(formatted_messages)}")
             print(f"[调试] 请求消息:")
-            print(json.dumps(formatted_messages, ensure_ascii=False, indent=2))
+            print(self._debug_dump(formatted_messages))
             print("-" * 50)
         
-        try:
-            start_time = time.time()
-            
-            # 为思考类型模型调整参数
-            api_params = {
-                "model": model,
-                "messages": formatted_messages,
-                "stream": False
-            }
-            
-            # 只为非思考类型模型设置temperature等参数
-            if not is_reasoning_model:
-                api_params["temperature"] = temperature
-            
-            if max_tokens:
-                api_params["max_tokens"] = max_tokens
-            elif is_reasoning_model:
-                # R1类模型建议设置更大的max_tokens，因为包含思考过程
-                api_params["max_tokens"] = 32768
-            
-            response = self.client.chat.completions.create(**api_params)
-            end_time = time.time()
-            
-            # 提取思考过程和回答内容
-            reasoning_content = ""
-            answer_content = ""
-            
-            if hasattr(response.choices[0].message, 'reasoning_content') and response.choices[0].message.reasoning_content:
-                reasoning_content = response.choices[0].message.reasoning_content
-            
-            answer_content = response.choices[0].message.content or ""
-            
-            # 始终记录调试信息到日志文件，无论是否debug模式
-            duration = end_time - start_time
-            if hasattr(self, '_debug_logger') and self._debug_logger:
-                self._debug_logger.info(f"模型调用时间: {duration:.2f}秒")
-                if hasattr(response, 'usage'):
-                    usage = response.usage
-                    self._debug_logger.info(f"Token使用: {usage.total_tokens} (输入: {usage.prompt_tokens}, 输出: {usage.completion_tokens})")
-                
-                if reasoning_content and is_reasoning_model:
-                    self._debug_logger.info(f"思考过程长度: {len(reasoning_content)} 字符")
-                    self._debug_logger.info(f"最终回答长度: {len(answer_content)} 字符")
-                    # 记录完整思考过程到调试日志
-                    self._debug_logger.debug(f"完整思考过程:\n{reasoning_content}")
-                    self._debug_logger.debug(f"最终回答:\n{answer_content}")
-            
-            # 控制台调试信息（仅在debug模式显示）
+        # 为思考类型模型调整参数
+        api_params = {
+            "model": model,
+            "messages": formatted_messages,
+            "stream": stream
+        }
+        
+        # 只为非思考类型模型设置temperature等参数
+        if not is_reasoning_model:
+            api_params["temperature"] = temperature
+        
+        if max_tokens:
+            api_params["max_tokens"] = max_tokens
+        elif is_reasoning_model:
+            # R1类模型建议设置更大的max_tokens，因为包含思考过程（按模型取默认上限）
+            api_params["max_tokens"] = _max_out(model)
+        
+        # 查询响应缓存（先做精确匹配，未命中时再做语义近似匹配）
+        cache_key = None
+        semantic_query = None
+        prefix_cache_path = None
+        cached = None
+        if use_cache if use_cache is not None else (temperature == 0 or is_reasoning_model):
+            if self.cache is not None:
+                cache_key = LLMCache.make_key(
+                    model, formatted_messages,
+                    api_params.get("temperature"), api_params.get("max_tokens")
+                )
+                if not return_full_response:
+                    cached = self.cache.get(cache_key)
+            if cached is None and self.prefix_cache is not None:
+                prefix_cache_path = self.prefix_cache.make_path(
+                    model, formatted_messages,
+                    api_params.get("temperature"), api_params.get("max_tokens")
+                )
+                if prefix_cache_path is not None and not return_full_response:
+                    cached = self.prefix_cache.get(prefix_cache_path)
+                    if cached is None and hasattr(self, '_debug_logger') and self._debug_logger \
+                            and self.prefix_cache.prefix_seen(model):
+                        self._debug_logger.info("系统提示前缀已有缓存，对话尾部未命中")
+            if cached is None and self.semantic_cache is not None:
+                semantic_query = self.semantic_cache.embed(SemanticCache.prompt_text(formatted_messages))
+                if not return_full_response:
+                    cached = self.semantic_cache.get(model, semantic_query)
+        
+        # 未命中缓存、即将发送请求时，先在本地检查上下文长度
+        if cached is None:
+            self._check_context_budget(model, formatted_messages, api_params, debug)
+        
+        return _ChatRequest(model, is_reasoning_model, formatted_messages, api_params,
+                           cache_key, semantic_query, prefix_cache_path, cached)
+    
+    def _check_context_budget(self, model: str, formatted_messages: List[Dict[str, Any]],
+                              api_params: Dict[str, Any], debug: bool):
+        """
+        请求前估算输入token数（需安装tiktoken，且仅针对已知上下文窗口的模型）
+        
+        输入本身超出上下文窗口时直接抛出 ContextOverflowError，省去一次注定失败的API往返；
+        输入加上 max_tokens 超出时调低 max_tokens，使回答不超过剩余窗口
+        
+        Raises:
+            ContextOverflowError: 输入token数已超出模型上下文窗口
+        """
+        window = _context_window(model)
+        if window is None:
+            return
+        encoding = _token_encoding()
+        if encoding is None:
+            return
+        
+        input_tokens = _count_message_tokens(encoding, formatted_messages)
+        if input_tokens >= window:
+            raise ContextOverflowError(f"请求消息约 {input_tokens} tokens，已超出 {model} 的上下文窗口 {window} tokens")
+        
+        max_tokens = api_params.get("max_tokens")
+        if max_tokens and input_tokens + max_tokens > window:
+            api_params["max_tokens"] = window - input_tokens
+            message = f"输入约 {input_tokens} tokens，max_tokens 由 {max_tokens} 调整为 {window - input_tokens}"
+            if self._debug_logger is not None:
+                self._debug_logger.warning(message)
             if debug:
-                print(f"[调试] 响应时间: {duration:.2f}秒")
-                if hasattr(response, 'usage'):
-                    usage = response.usage
-                    print(f"[调试] Token使用: {usage.total_tokens} (输入: {usage.prompt_tokens}, 输出: {usage.completion_tokens})")
-                
-                if reasoning_content and is_reasoning_model:
-                    print(f"[调试] 思考过程长度: {len(reasoning_content)} 字符")
-                    print(f"[调试] 思考过程预览: {reasoning_content[:500]}{'...' if len(reasoning_content) > 500 else ''}")
-                    print(f"[调试] 最终回答: {answer_content}")
-                print("-" * 50)
+                print(f"[调试] {message}")
+    
+    @staticmethod
+    def _debug_dump(messages: List[Dict[str, Any]]) -> str:
+        """格式化调试输出的请求消息，超过 _DEBUG_MAX 条时只保留最近的消息"""
+        if len(messages) <= _DEBUG_MAX:
+            return json_utils.dumps(messages, indent=True)
+        omitted = len(messages) - _DEBUG_MAX
+        return f"（省略前 {omitted} 条消息）\n" + json_utils.dumps(messages[-_DEBUG_MAX:], indent=True)
+    
+    def _cached_result(self, cached: Dict[str, Any], debug: bool,
+                       return_reasoning: bool) -> Union[str, tuple[str, str]]:
+        """按调用参数返回缓存中的结果"""
+        if hasattr(self, '_debug_logger') and self._debug_logger:
+            self._debug_logger.info("命中模型响应缓存，跳过API调用")
+        if debug:
+            print("[调试] 命中模型响应缓存，跳过API调用")
+            print("-" * 50)
+        if return_reasoning and cached["reasoning"]:
+            return (cached["reasoning"], cached["content"])
+        return cached["content"]
+    
+    @staticmethod
+    def _extract_response(response) -> "ChatResult":
+        """从API响应中一次性提取回答、思考过程和token用量"""
+        message = response.choices[0].message
+        return ChatResult.from_parts(
+            message.content or "",
+            getattr(message, 'reasoning_content', None) or "",
+            getattr(response, 'usage', None)
+        )
+    
+    @staticmethod
+    def _consume_stream(stream, on_chunk: Optional[Callable[[str], None]]) -> "ChatResult":
+        """逐块累积流式响应，返回回答、思考过程和token用量"""
+        reasoning_parts = []
+        answer_parts = []
+        usage = None
+        for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            reasoning = getattr(delta, 'reasoning_content', None)
+            if reasoning:
+                reasoning_parts.append(reasoning)
+            if delta.content:
+                answer_parts.append(delta.content)
+                if on_chunk is not None:
+                    on_chunk(delta.content)
+        return ChatResult.from_parts("".join(answer_parts), "".join(reasoning_parts), usage)
+    
+    def _finish_chat(self, request: "_ChatRequest", response, result: "ChatResult", debug: bool,
+                     return_full_response: bool,
+                     return_reasoning: bool) -> Union[str, Dict[str, Any], tuple[str, str]]:
+        """写入缓存并记录调用信息，按调用参数返回结果"""
+        model = request.model
+        is_reasoning_model = request.is_reasoning_model
+        cache_key = request.cache_key
+        semantic_query = request.semantic_query
+        prefix_cache_path = request.prefix_cache_path
+        reasoning_content = result.reasoning
+        answer_content = result.content
+        duration = result.duration
+        
+        if cache_key is not None or semantic_query is not None or prefix_cache_path is not None:
+            usage_info = result.usage_info()
+            if cache_key is not None:
+                self.cache.put(cache_key, answer_content, reasoning_content, usage_info)
+            if prefix_cache_path is not None:
+                self.prefix_cache.put(prefix_cache_path, answer_content, reasoning_content, usage_info)
+            if semantic_query is not None:
+                self.semantic_cache.put(model, semantic_query, answer_content, reasoning_content, usage_info)
+        
+        # 始终记录调试信息到日志文件，无论是否debug模式
+        if hasattr(self, '_debug_logger') and self._debug_logger:
+            self._debug_logger.info(f"模型调用时间: {duration:.2f}秒")
+            if result.total_tokens:
+                self._debug_logger.info(f"Token使用: {result.total_tokens} (输入: {result.prompt_tokens}, 输出: {result.completion_tokens})")
             
-            # 根据参数返回不同结果
-            if return_full_response:
-                return response
-            elif return_reasoning and reasoning_content:
-                return (reasoning_content, answer_content)
-            else:
-                return answer_content
-                
-        except Exception as e:
-            # 始终记录API调用失败到日志
-            if hasattr(self, '_debug_logger') and self._debug_logger:
-                self._debug_logger.error(f"API 调用失败: {e}")
-                # 记录完整异常信息
-                import traceback
-                full_traceback = traceback.format_exc()
-                self._debug_logger.debug(f"API调用异常堆栈:\n{full_traceback}")
+            if reasoning_content and is_reasoning_model:
+                self._debug_logger.info(f"思考过程长度: {len(reasoning_content)} 字符")
+                self._debug_logger.info(f"最终回答长度: {len(answer_content)} 字符")
+                # 记录完整思考过程到调试日志
+                self._debug_logger.debug("完整思考过程:\n%s", reasoning_content)
+                self._debug_logger.debug("最终回答:\n%s", answer_content)
+        
+        # 控制台调试信息（仅在debug模式显示）
+        if debug:
+            print(f"[调试] 响应时间: {duration:.2f}秒")
+            if result.total_tokens:
+                print(f"[调试] Token使用: {result.total_tokens} (输入: {result.prompt_tokens}, 输出: {result.completion_tokens})")
             
-            if debug:
-                print(f"[调试] API 调用失败: {e}")
-            else:
-                print(f"❌ API调用失败: {e}")
-            raise
-
+            if reasoning_content and is_reasoning_model:
+                print(f"[调试] 思考过程长度: {len(reasoning_content)} 字符")
+                print(f"[调试] 思考过程预览: {reasoning_content[:500]}{'...' if len(reasoning_content) > 500 else ''}")
+                print(f"[调试] 最终回答: {answer_content}")
+            print("-" * 50)
+        
+        # 根据参数返回不同结果
+        if return_full_response:
+            return response
+        elif return_reasoning and reasoning_content:
+            return (reasoning_content, answer_content)
+        else:
+            return answer_content
+    
+    def _log_api_error(self, e: Exception, debug: bool):
+        """记录API调用失败（需在except块中调用以获取异常堆栈）"""
+        # 始终记录API调用失败到日志
+        if hasattr(self, '_debug_logger') and self._debug_logger:
+            self._debug_logger.error(f"API 调用失败: {e}")
+            # 记录完整异常信息
+            import traceback
+            full_traceback = traceback.format_exc()
+            self._debug_logger.debug(f"API调用异常堆栈:\n{full_traceback}")
+        
+        if debug:
+            print(f"[调试] API 调用失败: {e}")
+        else:
+            print(f"❌ API调用失败: {e}")
+    
     def chat_completion(self, 
                        messages: List[Dict[str, str]], 
                        model: str = "deepseek-v3:671b",
@@ -224,16 +680,15 @@ class ModelClient:
             API响应结果
         """
         try:
-            response = self.client.chat.completions.create(
+            return self._invoke(
                 model=model,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
                 stream=False
             )
-            return response
         except Exception as e:
-            print(f"❌ API调用失败:{e}")
+            self._log_api_error(e, debug=False)
             raise
     
     def simple_query(self, prompt: str, model: str = "deepseek-v3:671b") -> str:
@@ -298,22 +753,29 @@ class ModelClient:
         Returns:
             是否为思考类型模型
         """
-        return any(keyword in model.lower() for keyword in ['r1', 'qwen3', 'reasoner'])
+        return _is_reasoning_model(model)
     
     def get_available_models(self) -> List[Dict[str, Any]]:
         """
-        获取可用的模型列表
+        获取可用的模型列表（首次调用时请求API，之后复用结果，需要最新列表时先调用 refresh_models）
         
         Returns:
             模型列表，每个模型包含 id, object, created, owned_by 等信息
         """
+        if self._models is not None:
+            return self._models
         try:
             response = self.client.models.list()
-            return response.data
+            self._models = response.data
+            return self._models
         except Exception as e:
             print(f"获取模型列表失败: {e}")
             raise
     
+    def refresh_models(self):
+        """清除缓存的模型列表，下次查询时重新请求API"""
+        self._models = None
+    
     def list_models(self) -> None:
         """
         打印可用模型列表（格式化输出）
@@ -347,8 +809,9 @@ class ModelClient:
             return []
 
 
+@functools.lru_cache(maxsize=1)
 def create_model_client() -> ModelClient:
-    """创建模型客户端实例"""
+    """获取模型客户端实例（进程内共享同一实例，复用其HTTP连接池）"""
     return ModelClient()
 
 
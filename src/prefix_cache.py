@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: claude89757
+@date: 2025-07-12
+@description: 按系统提示前缀分目录的磁盘响应缓存 - 智能体每个请求都以同一份系统提示开头，
+              前缀只需按模型哈希一次，之后每次请求只对对话尾部计算哈希
+"""
+
+import os
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional
+
+try:
+    from .prompt import SYSTEM_PROMPT, SYSTEM_PROMPT_BYTES
+    from .utils import json_utils
+except ImportError:
+    # 以脚本方式运行时 src 目录即为 sys.path[0]
+    from prompt import SYSTEM_PROMPT, SYSTEM_PROMPT_BYTES
+    from utils import json_utils
+
+
+class PrefixCache:
+    """
+    磁盘响应缓存，目录结构为 {cache_dir}/{前缀哈希}/{尾部哈希}.json
+    
+    只缓存以已知系统提示开头的请求；前缀哈希由（系统提示, 模型）决定，按模型计算一次后复用
+    """
+    
+    def __init__(self, cache_dir: str = ".cache/llm", system_prompt: str = SYSTEM_PROMPT):
+        """
+        初始化前缀缓存
+        
+        Args:
+            cache_dir: 缓存根目录
+            system_prompt: 作为共享前缀的系统提示
+        """
+        self.cache_dir = cache_dir
+        self.system_prompt = system_prompt
+        self._system_prompt_bytes = (
+            SYSTEM_PROMPT_BYTES if system_prompt is SYSTEM_PROMPT else system_prompt.encode('utf-8')
+        )
+        self._prefix_hashes: Dict[str, str] = {}
+    
+    def prefix_hash(self, model: str) -> str:
+        """计算（系统提示, 模型）前缀的哈希，每个模型只计算一次"""
+        prefix_hash = self._prefix_hashes.get(model)
+        if prefix_hash is None:
+            prefix_hash = hashlib.blake2b(
+                self._system_prompt_bytes + model.encode('utf-8'), digest_size=16
+            ).hexdigest()
+            self._prefix_hashes[model] = prefix_hash
+        return prefix_hash
+    
+    def make_path(self, model: str, messages: List[Dict[str, Any]], temperature: Optional[float],
+                  max_tokens: Optional[int]) -> Optional[str]:
+        """
+        计算请求对应的缓存文件路径
+        
+        Returns:
+            消息以已知系统提示开头时返回缓存文件路径，否则返回None（不缓存）
+        """
+        if not messages:
+            return None
+        first_message = messages[0]
+        if first_message.get("role") != "system":
+            return None
+        content = first_message.get("content")
+        if content is not self.system_prompt and content != self.system_prompt:
+            return None
+        
+        tail = json_utils.dumps({"messages": messages[1:], "temperature": temperature, "max_tokens": max_tokens})
+        tail_hash = hashlib.sha256(tail.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, self.prefix_hash(model), f"{tail_hash}.json")
+    
+    def prefix_seen(self, model: str) -> bool:
+        """该模型下是否已缓存过以此系统提示开头的请求"""
+        return os.path.isdir(os.path.join(self.cache_dir, self.prefix_hash(model)))
+    
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        """读取缓存文件，命中时返回 {"content", "reasoning", "usage"}"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json_utils.loads(f.read())
+        except (OSError, ValueError):
+            return None
+    
+    def put(self, path: str, content: str, reasoning: str = "", usage: Optional[Dict[str, int]] = None):
+        """原子写入缓存文件（先写临时文件再替换，并发写同一条目时不会读到半截内容）"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json_utils.dumps({"content": content, "reasoning": reasoning, "usage": usage}))
+        os.replace(tmp_path, path)
@@ -1,3 +1,5 @@
+import re
+
 SYSTEM_PROMPT = """
 You are Roo, an expert microservice fault diagnosis assistant specializing in systematic problem diagnosis and root cause analysis for the CCF AIOps Challenge 2025. You operate autonomously without requiring user interaction or feedback.
 
@@ -276,4 +278,13 @@ Work methodically through each step, using tools to gather evidence and build to
 - ✅ No pending analysis items (like "TraceAnalysisPending")
 
 **Success Criteria**: Accurate component identification + precise fault classification + efficient reasoning path + comprehensive evidence coverage = maximum competition score.
-"""
\ No newline at end of file
+"""
+
+# 系统提示的UTF-8编码（模块加载时编码一次，供缓存键等需要字节串的场景复用）
+SYSTEM_PROMPT_BYTES = SYSTEM_PROMPT.encode('utf-8')
+
+# 系统提示中定义的工具（工具名即XML标签名）
+TOOL_NAMES = ('preview_parquet_in_pd', 'get_data_from_parquet', 'attempt_completion')
+
+# 匹配任一工具调用的XML片段（预编译一次，各处解析模型回复时共用，单次扫描即可按出现顺序取出全部调用）
+TOOL_CALL_RE = re.compile(r'<(' + '|'.join(TOOL_NAMES) + r')\b[^>]*>(.*?)</\1>', re.DOTALL)
@@ -8,25 +8,327 @@
 """
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
 import os
+import re
 import json
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Dict, Any, Optional, Union
 
+try:
+    from .utils import json_utils
+except ImportError:
+    # 以脚本方式运行时 src 目录即为 sys.path[0]
+    from utils import json_utils
+
+# 时间列名识别（忽略大小写，模块级预编译）
+_TIME_COLUMN_PATTERN = re.compile(r'time|timestamp|date', re.IGNORECASE)
+
+# pyarrow扫描时支持下推的pandas.read_parquet参数，包含其他参数时交给pandas处理
+_SCAN_KWARGS = frozenset(('columns', 'filters'))
+
+# 按元数据估算token数下界时，字符串列每个字符至多占用的UTF-8字节数（未压缩大小除以它不会高估字符数）
+_MAX_UTF8_CHAR_BYTES = 4
+
+# 限制行数扫描时的最小批大小（过滤条件选择性高时避免大量过小的批）
+_MIN_SCAN_BATCH_SIZE = 1024
+
+# 取值种类不超过该数量的字符串列按字典编码转换，相同取值共享同一个Python字符串对象
+_DICTIONARY_MAX_DISTINCT = 64
+
+# pandas风格过滤条件到pyarrow表达式的转换（pyarrow 10起为公开接口）
+_filters_to_expression = getattr(pq, 'filters_to_expression', None) or pq._filters_to_expression
+
+
+def _string_column_to_pylist(column: pa.ChunkedArray) -> list:
+    """
+    字符串列转为Python列表；低基数列（如 level、k8_pod）经字典编码，每种取值只生成一个字符串对象
+    
+    Args:
+        column: 字符串数据列
+    
+    Returns:
+        列中各行的Python取值
+    """
+    encoded = column.combine_chunks().dictionary_encode()
+    values = encoded.dictionary.to_pylist()
+    if len(values) > _DICTIONARY_MAX_DISTINCT:
+        return column.to_pylist()
+    # 空值的索引指向末尾追加的None
+    values.append(None)
+    indices = pc.fill_null(encoded.indices, len(values) - 1).to_pylist()
+    return list(map(values.__getitem__, indices))
+
+
+@lru_cache(maxsize=64)
+def _column_converters(schema: pa.Schema) -> tuple:
+    """按schema选定各列的Arrow→Python转换函数（同一类文件schema相同，列类型只判断一次）"""
+    return tuple(
+        _string_column_to_pylist
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+        else pa.ChunkedArray.to_pylist
+        for field in schema
+    )
+
+
+def _table_to_split(table: pa.Table) -> Dict[str, Any]:
+    """Arrow表按列转为Python对象，组装为 orient='split' 格式（不经过DataFrame和逐行字典）"""
+    converters = _column_converters(table.schema)
+    return {
+        "columns": table.column_names,
+        "data": [list(row) for row in zip(*(convert(column) for convert, column in zip(converters, table.columns)))]
+    }
+
+
+def _freeze_filters(filters: Any) -> Any:
+    """把过滤条件中的列表递归转为元组，作为表达式缓存的键"""
+    if isinstance(filters, (list, tuple)):
+        return tuple(_freeze_filters(item) for item in filters)
+    return filters
+
+
+@lru_cache(maxsize=256)
+def _compile_filters(frozen_filters: tuple) -> ds.Expression:
+    """将（已冻结的）pandas风格过滤条件编译为pyarrow表达式，相同过滤条件只编译一次"""
+    return _filters_to_expression(frozen_filters)
+
+
+def _filter_expression(filters: Any) -> ds.Expression:
+    """获取过滤条件对应的pyarrow表达式（过滤值不可哈希时直接编译，不缓存）"""
+    try:
+        return _compile_filters(_freeze_filters(filters))
+    except TypeError:
+        return _filters_to_expression(filters)
+
+
+@dataclass(frozen=True)
+class _ParquetMeta:
+    """parquet文件的大小和footer元数据（按文件修改时间缓存）"""
+    file_size_mb: float
+    metadata: pq.FileMetaData
+    schema: pa.Schema
+    column_bytes: Dict[str, float]  # 各列每个值的平均未压缩字节数（来自列块统计）
+    
+    @property
+    def num_rows(self) -> int:
+        return self.metadata.num_rows
+
+
+@lru_cache(maxsize=128)
+def _get_parquet_meta(file_path: str, mtime_ns: int, size: int) -> _ParquetMeta:
+    """
+    读取parquet文件的footer元数据（修改时间和大小参与缓存键，文件变化后自动失效）
+    
+    Args:
+        file_path: parquet文件路径
+        mtime_ns: 文件修改时间（纳秒）
+        size: 文件大小（字节）
+    """
+    metadata = pq.read_metadata(file_path)
+    
+    # 汇总各行组的列块大小（嵌套列按顶层列名合并）
+    total_bytes: Dict[str, int] = {}
+    for row_group_index in range(metadata.num_row_groups):
+        row_group = metadata.row_group(row_group_index)
+        for column_index in range(row_group.num_columns):
+            column_chunk = row_group.column(column_index)
+            name = column_chunk.path_in_schema.split('.', 1)[0]
+            total_bytes[name] = total_bytes.get(name, 0) + column_chunk.total_uncompressed_size
+    num_rows = max(metadata.num_rows, 1)
+    column_bytes = {name: size_bytes / num_rows for name, size_bytes in total_bytes.items()}
+    
+    return _ParquetMeta(size / (1024 * 1024), metadata, metadata.schema.to_arrow_schema(), column_bytes)
+
+
+def _parquet_meta(file_path: str) -> _ParquetMeta:
+    """获取parquet文件元数据（同一文件未修改时只解析一次footer）"""
+    stat = os.stat(file_path)
+    return _get_parquet_meta(file_path, stat.st_mtime_ns, stat.st_size)
+
+
+def _min_tokens(meta: _ParquetMeta, columns: Optional[list], nrows: Optional[int]) -> Optional[int]:
+    """
+    不读取数据，按元数据中的行数和各列大小估算返回数据token数的下界（实际估算值不会低于该值）
+    
+    Args:
+        meta: 文件元数据
+        columns: 读取的列，为None时为全部列
+        nrows: 行数限制
+    
+    Returns:
+        token数下界；列名不在元数据中时返回None
+    """
+    names = meta.schema.names if columns is None else columns
+    if not all(isinstance(name, str) and name in meta.column_bytes for name in names):
+        return None
+    rows = meta.num_rows if nrows is None else min(nrows, meta.num_rows)
+    # 与 _table_json_chars 相同的每行开销；字符串列按每字符最多4字节折算（长度前缀抵消引号），其余列每个值至少1个字符
+    row_chars = 4
+    for name in names:
+        column_type = meta.schema.field(name).type
+        if pa.types.is_string(column_type) or pa.types.is_large_string(column_type):
+            value_chars = meta.column_bytes[name] / _MAX_UTF8_CHAR_BYTES
+        else:
+            value_chars = 1
+        row_chars += len(name) + 6 + value_chars
+    return int(rows * row_chars) // 3
+
+
+def _data_too_large_result(result: Dict[str, Any], estimated_tokens: int, max_tokens: int,
+                           num_rows: int, num_columns: int) -> Dict[str, Any]:
+    """在返回信息中填入数据过大的错误和优化建议（不返回实际数据）"""
+    result.update({
+        "data_too_large": True,
+        "error": f"Data too large, estimated {estimated_tokens} tokens, exceeds {max_tokens} token limit",
+        "suggestion": "Please adjust filter conditions to reduce data size, recommended actions:",
+        "optimization_tips": [
+            "1. Use nrows parameter to limit rows, e.g.: {'nrows': 100}",
+            "2. Use columns parameter to read only needed columns, e.g.: {'columns': ['timestamp', 'message']}",
+            "3. Use filters parameter to filter data, e.g.: {'filters': [('level', '==', 'ERROR')]}",
+            "4. Combine multiple conditions: {'nrows': 200, 'columns': ['time', 'level', 'message']}"
+        ],
+        "current_row_count": num_rows,
+        "current_column_count": num_columns,
+        "recommended_max_rows": min(300, max_tokens // (num_columns * 12))  # 更保守的建议行数，从500改为300，从10改为12
+    })
+    return result
+
+
+def _scan_parquet(file_path: str, pd_read_kwargs: dict, meta: _ParquetMeta,
+                  nrows: Optional[int] = None) -> pa.Table:
+    """
+    读取parquet文件为Arrow表（预览和取数共用），列选择和过滤条件下推到pyarrow，指定nrows时读够即停止
+    
+    Args:
+        file_path: parquet文件路径
+        pd_read_kwargs: pandas.read_parquet的参数（columns、filters），包含其他参数时交给pandas处理
+        meta: 文件元数据（复用已解析的footer，打开文件时无需再次读取）
+        nrows: 最多读取的行数，为None时读取全部匹配行
+    
+    Returns:
+        读取结果Arrow表
+    """
+    if not _SCAN_KWARGS.issuperset(pd_read_kwargs):
+        df = pd.read_parquet(file_path, **pd_read_kwargs)
+        return pa.Table.from_pandas(df if nrows is None else df.head(nrows), preserve_index=False)
+    
+    columns = pd_read_kwargs.get('columns')
+    filters = pd_read_kwargs.get('filters')
+    if filters:
+        # 有过滤条件：通过数据集扫描下推过滤表达式（多线程按行组并行解码）
+        scan_options = {"columns": columns, "filter": _filter_expression(filters), "use_threads": True}
+        dataset = ds.dataset(file_path, format='parquet', schema=meta.schema)
+        if nrows is None:
+            return dataset.scanner(**scan_options).to_table()
+        scan_options["batch_size"] = max(nrows, _MIN_SCAN_BATCH_SIZE)
+        return dataset.scanner(**scan_options).head(nrows)
+    
+    parquet_file = pq.ParquetFile(file_path, metadata=meta.metadata)
+    if nrows is None:
+        return parquet_file.read(columns=columns, use_threads=True)
+    
+    # 按批读取前nrows行（批可能在行组边界处截断，读够为止）
+    batches = []
+    remaining = nrows
+    if remaining > 0:
+        for batch in parquet_file.iter_batches(batch_size=nrows, columns=columns, use_threads=True):
+            batches.append(batch.slice(0, remaining))
+            remaining -= batch.num_rows
+            if remaining <= 0:
+                # 读够即停止，不再解码下一批
+                break
+    if not batches:
+        # 空文件：按schema构造空表，保留列名和类型
+        table = meta.schema.empty_table()
+        return table.select(list(columns)) if columns is not None else table
+    return pa.Table.from_batches(batches)
+
+
+def _column_json_chars(column: pa.ChunkedArray) -> int:
+    """估算一列数据序列化为JSON后的字符数（按列向量化计算，不生成JSON字符串）"""
+    column_type = column.type
+    if pa.types.is_string(column_type) or pa.types.is_large_string(column_type):
+        # 字符串：字符数 + 两侧引号
+        chars = (pc.sum(pc.utf8_length(column)).as_py() or 0) + 2 * (len(column) - column.null_count)
+    else:
+        try:
+            text = pc.cast(column, pa.string())
+        except (pa.ArrowNotImplementedError, pa.ArrowInvalid):
+            # 嵌套类型等无法转为字符串的列，按Python对象序列化
+            return len(json.dumps(column.to_pylist(), ensure_ascii=False, default=str))
+        chars = pc.sum(pc.utf8_length(text)).as_py() or 0
+        if not (pa.types.is_integer(column_type) or pa.types.is_floating(column_type)
+                or pa.types.is_boolean(column_type)):
+            # 时间等类型在JSON中为带引号的字符串
+            chars += 2 * (len(column) - column.null_count)
+    # 空值序列化为 null
+    return chars + 4 * column.null_count
+
+
+def _table_json_chars(table: pa.Table) -> int:
+    """估算表按 orient='records' 序列化为JSON后的字符数"""
+    # 每行的花括号、行间分隔符，以及每个字段的 "列名": 和字段间分隔符
+    row_overhead = 4 + sum(len(name) + 6 for name in table.column_names)
+    return table.num_rows * row_overhead + sum(_column_json_chars(column) for column in table.columns)
+
+
+def _numeric_summary(table: pa.Table) -> Dict[str, Dict[str, Any]]:
+    """
+    数值列统计（字段与 DataFrame.describe() 一致），在Arrow缓冲区上向量化计算
+    
+    Args:
+        table: 数据表
+    
+    Returns:
+        {列名: {"count", "mean", "std", "min", "25%", "50%", "75%", "max"}}，无数值列时为空字典
+    """
+    summary = {}
+    for name, column in zip(table.column_names, table.columns):
+        column_type = column.type
+        if not (pa.types.is_integer(column_type) or pa.types.is_floating(column_type)):
+            continue
+        min_max = pc.min_max(column)
+        if column.null_count < len(column):
+            quartiles = pc.quantile(column, q=[0.25, 0.5, 0.75]).to_pylist()
+        else:
+            quartiles = [None, None, None]
+        summary[name] = {
+            "count": len(column) - column.null_count,
+            "mean": pc.mean(column).as_py(),
+            "std": pc.stddev(column, ddof=1).as_py(),
+            "min": min_max["min"].as_py(),
+            "25%": quartiles[0],
+            "50%": quartiles[1],
+            "75%": quartiles[2],
+            "max": min_max["max"].as_py(),
+        }
+    return summary
+
 
 def estimate_tokens(data: Any) -> int:
     """
     估算数据的token数量
     
     Args:
-        data: 要估算的数据
+        data: 要估算的数据；Arrow表或DataFrame按列计算序列化后的长度，无需实际生成JSON
     
     Returns:
         估算的token数量
     """
     try:
-        # 将数据转换为JSON字符串
+        # 表格数据：按列统计字符数
+        if isinstance(data, pd.DataFrame):
+            data = pa.Table.from_pandas(data, preserve_index=False)
+        if isinstance(data, pa.Table):
+            return _table_json_chars(data) // 3
+        
+        # 将数据转换为JSON字符串（orjson可用时为C实现）
         if isinstance(data, (dict, list)):
-            json_str = json.dumps(data, ensure_ascii=False)
+            json_str = json_utils.dumps(data)
         else:
             json_str = str(data)
         
@@ -54,33 +356,35 @@ def preview_parquet_in_pd(file_path: str, pd_read_kwargs: dict = {}) -> Dict[str
         包含文件基本信息、列信息和示例数据的字典
     """
     try:
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
+        # 文件大小和总行数来自（缓存的）元数据，只读取预览所需的前几行
+        # 获取元数据时的一次stat同时完成存在性检查
+        try:
+            meta = _parquet_meta(file_path)
+        except FileNotFoundError:
             return {
                 "error": f"File not found: {file_path}",
                 "suggestion": "Please check if the file path is correct"
             }
-        
-        # 读取数据（先读取完整数据，然后取前几行用于预览）
-        df = pd.read_parquet(file_path, **pd_read_kwargs)
-        
-        # 限制预览行数
+        file_size_mb = meta.file_size_mb
         preview_rows = 3
-        df = df.head(preview_rows)
-        
-        # 获取文件大小
-        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
+        table = _scan_parquet(file_path, pd_read_kwargs, meta, preview_rows)
+        memory_mb = table.nbytes / (1024 * 1024)
+        null_counts = dict(zip(table.column_names, (column.null_count for column in table.columns)))
+        # 有过滤条件时元数据中的总行数不代表匹配行数
+        total_rows = None if pd_read_kwargs.get('filters') else meta.num_rows
         
         # 构建预览信息
         preview_info = {
             "file_path": file_path,
             "file_size_mb": round(file_size_mb, 2),
-            "shape": f"({df.shape[0]} rows × {df.shape[1]} columns) - Only showing first {preview_rows} rows",
-            "columns": list(df.columns),
-            "dtypes": df.dtypes.astype(str).to_dict(),
-            "sample_data": df.to_dict(orient='records'),
-            "memory_usage_mb": round(df.memory_usage(deep=True).sum() / (1024 * 1024), 3),
-            "null_counts": df.isnull().sum().to_dict(),
+            "shape": f"({table.num_rows} rows × {table.num_columns} columns) - Only showing first {preview_rows} rows",
+            "total_rows": total_rows,
+            "columns": table.column_names,
+            # 列类型直接取自Arrow schema（如 int64、string），无需转换为DataFrame
+            "dtypes": {field.name: str(field.type) for field in table.schema},
+            "sample_data": table.to_pylist(),
+            "memory_usage_mb": round(memory_mb, 3),
+            "null_counts": null_counts,
             "ai_tips": "This is a data preview. Use get_data_from_parquet function for complete data"
         }
         
@@ -113,15 +417,16 @@ def get_data_from_parquet(file_path: str, pd_read_kwargs: dict = {}) -> Dict[str
         包含数据和相关信息的字典
     """
     try:
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
+        # 获取文件大小（元数据按文件缓存，预览过的文件无需再次解析footer）
+        # 获取元数据时的一次stat同时完成存在性检查
+        try:
+            meta = _parquet_meta(file_path)
+        except FileNotFoundError:
             return {
                 "error": f"File not found: {file_path}",
                 "suggestion": "Please check if the file path is correct"
             }
-        
-        # 获取文件大小
-        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
+        file_size_mb = meta.file_size_mb
         
         # 检查是否需要限制行数
         original_kwargs = pd_read_kwargs.copy()  # 保存原始参数
@@ -133,59 +438,62 @@ def get_data_from_parquet(file_path: str, pd_read_kwargs: dict = {}) -> Dict[str
             nrows_limit = 800  # 从1000改为800，更严格的限制
             suggested_limit = True
         
-        # 读取数据
-        df = pd.read_parquet(file_path, **pd_read_kwargs)
+        max_tokens = 6000  # 大幅降低最大token限制，从10000改为6000
         
-        # 应用行数限制
-        if nrows_limit is not None:
-            df = df.head(nrows_limit)
+        # 无过滤条件时读取的行数由元数据即可确定：token数下界已超限时不读取数据直接返回，否则以实际读取后的估算为准
+        if not pd_read_kwargs.get('filters') and _SCAN_KWARGS.issuperset(pd_read_kwargs):
+            columns = pd_read_kwargs.get('columns')
+            predicted_tokens = _min_tokens(meta, columns, nrows_limit)
+            if predicted_tokens is not None and predicted_tokens > max_tokens:
+                num_rows = meta.num_rows if nrows_limit is None else min(nrows_limit, meta.num_rows)
+                num_columns = len(meta.schema.names if columns is None else columns)
+                result = {
+                    "file_path": file_path,
+                    "shape": (num_rows, num_columns),
+                    "columns": list(meta.schema.names if columns is None else columns),
+                    "read_params": original_kwargs,
+                    "actual_rows_read": 0,
+                    "estimated_tokens": predicted_tokens,
+                    "estimated_from_metadata": True
+                }
+                return _data_too_large_result(result, predicted_tokens, max_tokens, num_rows, num_columns)
         
-        # 计算内存使用
-        memory_mb = df.memory_usage(deep=True).sum() / (1024 * 1024)
+        # 读取数据（行数限制下推到扫描，读够即停止）
+        table = _scan_parquet(file_path, pd_read_kwargs, meta, nrows_limit)
         
-        # 准备返回的数据
-        data_dict = df.to_dict(orient='records')
+        # 估算token数量（直接在Arrow表上按列计算，数据过大时不再生成逐行字典）
+        estimated_tokens = estimate_tokens(table)
         
-        # 估算token数量
-        estimated_tokens = estimate_tokens(data_dict)
-        max_tokens = 6000  # 大幅降低最大token限制，从10000改为6000
+        # 计算内存使用（Arrow缓冲区大小，无需逐个统计Python对象）
+        memory_mb = table.nbytes / (1024 * 1024)
+        num_rows, num_columns = table.num_rows, table.num_columns
         
         # 构建返回信息
         result = {
             "file_path": file_path,
-            "shape": df.shape,
-            "columns": list(df.columns),
+            "shape": (num_rows, num_columns),
+            "columns": table.column_names,
             "memory_usage_mb": round(memory_mb, 3),
             "read_params": original_kwargs,
-            "actual_rows_read": df.shape[0],
+            "actual_rows_read": num_rows,
             "estimated_tokens": estimated_tokens
         }
         
         # 检查token数量是否超限
         if estimated_tokens > max_tokens:
-            result.update({
-                "data_too_large": True,
-                "error": f"Data too large, estimated {estimated_tokens} tokens, exceeds {max_tokens} token limit",
-                "suggestion": "Please adjust filter conditions to reduce data size, recommended actions:",
-                "optimization_tips": [
-                    "1. Use nrows parameter to limit rows, e.g.: {'nrows': 100}",
-                    "2. Use columns parameter to read only needed columns, e.g.: {'columns': ['timestamp', 'message']}",
-                    "3. Use filters parameter to filter data, e.g.: {'filters': [('level', '==', 'ERROR')]}",
-                    "4. Combine multiple conditions: {'nrows': 200, 'columns': ['time', 'level', 'message']}"
-                ],
-                "current_row_count": df.shape[0],
-                "current_column_count": df.shape[1],
-                "recommended_max_rows": min(300, max_tokens // (len(df.columns) * 12))  # 更保守的建议行数，从500改为300，从10改为12
-            })
-            # 不返回实际数据
-            return result
+            # 不返回实际数据（数据过大时无需转换为DataFrame）
+            return _data_too_large_result(result, estimated_tokens, max_tokens, num_rows, num_columns)
+        
+        # 数值列统计直接基于Arrow表计算
+        numeric_summary = _numeric_summary(table)
         
-        # 数据量合适，返回数据
-        result["data"] = data_dict
+        # 数据量合适，返回数据（split格式：{"columns": 列名列表, "data": 每行取值列表}，列名不随每行重复）
+        result["data"] = _table_to_split(table)
+        del table
         
         # 根据数据量添加相应的提示
-        if df.shape[0] > 300:  # 从500改为300，更早警告
-            result["ai_warning"] = f"Large dataset ({df.shape[0]} rows), may affect AI processing efficiency"
+        if num_rows > 300:  # 从500改为300，更早警告
+            result["ai_warning"] = f"Large dataset ({num_rows} rows), may affect AI processing efficiency"
             result["suggestion"] = "Recommend using nrows parameter to limit rows, or columns parameter to read only needed columns"
         
         if memory_mb > 3:  # 从5改为3，更早警告
@@ -197,17 +505,13 @@ def get_data_from_parquet(file_path: str, pd_read_kwargs: dict = {}) -> Dict[str
             result["suggestion"] = "If you need more data, please specify nrows parameter in pd_read_kwargs"
         
         # 为AI智能体提供数据理解辅助信息
-        if df.shape[1] > 0:
+        if num_columns > 0:
             # 数值列统计
-            numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-            if numeric_cols:
-                result["numeric_summary"] = df[numeric_cols].describe().to_dict()
+            if numeric_summary:
+                result["numeric_summary"] = numeric_summary
             
             # 时间列识别
-            time_cols = []
-            for col in df.columns:
-                if any(keyword in col.lower() for keyword in ['time', 'timestamp', 'date']):
-                    time_cols.append(col)
+            time_cols = [col for col in result["columns"] if _TIME_COLUMN_PATTERN.search(col)]
             if time_cols:
                 result["time_columns"] = time_cols
         
@@ -306,7 +610,7 @@ def test_get_data_from_parquet():
         print(f"建议最大行数: {result6.get('recommended_max_rows', 'N/A')}")
     else:
         print("✅ 通过过滤条件成功控制数据量")
-        print(f"实际数据示例(前2条): {result6.get('data', [])[:2]}")
+        print(f"实际数据示例(前2条): {result6.get('data', {}).get('data', [])[:2]}")
     
     # 测试7: 更严格的过滤 - 只读取关键列和更少行数
     print("\n测试7: 更严格过滤 - 最小数据集")
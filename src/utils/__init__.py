@@ -2,6 +2,6 @@
 工具类模块
 """
 
-# 这个模块暂时留空，未来可以添加工具函数
+from . import json_utils
 
-__all__ = [] 
\ No newline at end of file
+__all__ = ['json_utils']
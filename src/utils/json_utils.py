@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@author: claude89757
+@date: 2025-07-05
+@description: JSON序列化工具 - 优先使用orjson，未安装时回退到标准库json
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖
+    orjson = None
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """
+    序列化为JSON字符串，保留中文字符（orjson可用时直接序列化numpy数组和标量）
+    
+    Args:
+        obj: 要序列化的对象
+        indent: 是否使用2空格缩进
+        
+    Returns:
+        JSON字符串
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, option=option).decode('utf-8')
+        except TypeError:
+            # orjson不支持的类型交给标准库处理（行为与原实现一致）
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+
+
+def loads(text: str) -> Any:
+    """
+    解析JSON字符串，orjson不接受的输入（如NaN）交给标准库处理
+    
+    Args:
+        text: JSON字符串
+        
+    Returns:
+        解析结果
+        
+    Raises:
+        json.JSONDecodeError: 标准库也无法解析时抛出
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
+class JSONArrayWriter:
+    """
+    逐条写入JSON数组文件，输出格式与 json.dump(..., indent=2) 一致
+    
+    每写入一条即刷新到磁盘，中途异常退出时仍会补全数组结尾，保证已写入的结果可用
+    """
+    
+    def __init__(self, file_path: str):
+        self._file = open(file_path, 'w', encoding='utf-8')
+        self._count = 0
+        self._file.write('[')
+    
+    def write(self, item: Any):
+        """追加一个数组元素"""
+        text = dumps(item, indent=True).replace('\n', '\n  ')
+        self._file.write(('\n  ' if self._count == 0 else ',\n  ') + text)
+        self._file.flush()
+        self._count += 1
+    
+    def close(self):
+        """写入数组结尾并关闭文件"""
+        if self._file.closed:
+            return
+        try:
+            self._file.write('\n]' if self._count else ']')
+        finally:
+            self._file.close()
+    
+    def __enter__(self) -> "JSONArrayWriter":
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()